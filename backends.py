@@ -0,0 +1,163 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import cinemark_html
+import job_queue
+import metrics
+import scraper
+from scrape_jobs import ScrapeCancelled
+
+# 'selenium' drives a real browser; 'http' fetches and parses the HTML directly,
+# falling back to Selenium whenever a page can't be parsed; 'queue' leaves scraping
+# to worker processes (worker.py) through the database job queue
+SCRAPER_BACKEND = (os.getenv('SCRAPER_BACKEND') or 'selenium').lower()
+HTTP_TIMEOUT = float(os.getenv('HTTP_SCRAPE_TIMEOUT') or 20)
+HTTP_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+LIST_PAGES = [
+    (scraper.COMING_SOON_URL, "Coming Soon"),
+    (scraper.NOW_PLAYING_URL, "Now Playing"),
+    (scraper.EVENTS_URL, "Events"),
+]
+
+class ScraperBackend:
+    """
+    Where movie listings and showtimes come from. All methods are blocking and are
+    meant to run on the scraper threads (see scrape_jobs).
+    """
+    name = None
+
+    def scrape_all_movies(self, job=None, theater_url=None):
+        """Returns the de-duplicated list of movie dicts from all list pages, as seen from a theater."""
+        raise NotImplementedError
+
+    def get_specific_showtimes(self, movie_url, job=None, theater_url=None):
+        """Returns {date: [times]} at the theater, or a single {"Error"/"Notice": message} entry."""
+        raise NotImplementedError
+
+class SeleniumBackend(ScraperBackend):
+    name = 'selenium'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def scrape_all_movies(self, job=None, theater_url=None):
+        with self.pool.lease(job) as driver:
+            return scraper.scrape_all_movies(driver, job=job, theater_url=theater_url)
+
+    def get_specific_showtimes(self, movie_url, job=None, theater_url=None):
+        with self.pool.lease(job) as driver:
+            return scraper.get_specific_showtimes(driver, movie_url, job=job, theater_url=theater_url)
+
+class HttpBackend(ScraperBackend):
+    """
+    Fetches Cinemark pages with a pooled requests session and parses them with
+    cinemark_html, without a browser. Anything it can't parse is handed to the
+    fallback backend.
+    """
+    name = 'http'
+
+    def __init__(self, workers, fallback=None):
+        self.fallback = fallback
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, workers))
+        self._sessions = {}   # theater URL -> session holding that theater's location cookie
+        self._theater_lock = threading.Lock()
+
+    def _session(self, theater_url):
+        # The theater page sets the location cookie that the list and movie pages depend on
+        theater_url = theater_url or scraper.DEFAULT_THEATER_URL
+        with self._theater_lock:
+            session = self._sessions.get(theater_url)
+            if session is None:
+                session = requests.Session()
+                session.headers['User-Agent'] = HTTP_USER_AGENT
+                session.mount('https://', self._adapter); session.mount('http://', self._adapter)
+                with metrics.timer('page_load:http'):
+                    session.get(theater_url, timeout=HTTP_TIMEOUT).raise_for_status()
+                self._sessions[theater_url] = session
+        return session
+
+    def _get(self, session, url):
+        with metrics.timer('page_load:http'):
+            res = session.get(url, timeout=HTTP_TIMEOUT); res.raise_for_status()
+        return res.text
+
+    def _fall_back(self, what, error, method, *args, job=None, theater_url=None):
+        if self.fallback is None:
+            raise error
+        metrics.incr('http_fallbacks')
+        print(f"HTTP scraper could not handle {what} ({error}); falling back to {self.fallback.name}.")
+        return getattr(self.fallback, method)(*args, job=job, theater_url=theater_url)
+
+    def scrape_all_movies(self, job=None, theater_url=None):
+        try:
+            session = self._session(theater_url)
+            movies = []
+            for url, page_name in LIST_PAGES:
+                if job: job.check_cancelled()
+                scraper.report_progress(job, f"\nFetching '{page_name}' page: {url}")
+                page_movies = cinemark_html.parse_movie_list(self._get(session, url), url)
+                scraper.report_progress(job, f"Found {len(page_movies)} movies on '{page_name}' page.")
+                if job: job.emit(page_movies)
+                movies += page_movies
+            if not movies:
+                raise cinemark_html.ParseError("No movie blocks on any list page.")
+        except ScrapeCancelled: raise
+        except (requests.RequestException, cinemark_html.ParseError) as e:
+            return self._fall_back("the list pages", e, 'scrape_all_movies', job=job, theater_url=theater_url)
+        return list({movie['title']: movie for movie in movies}.values())
+
+    def get_specific_showtimes(self, movie_url, job=None, theater_url=None):
+        if not movie_url or 'cinemark.com' not in movie_url: return {"Error": "Invalid URL"}
+        try:
+            session = self._session(theater_url)
+            print(f"    -> Fetching movie page for specific showtimes: {movie_url}")
+            page = self._get(session, movie_url)
+            dates = cinemark_html.parse_show_dates(page, movie_url)
+            if not dates: return {"Notice": "Showtimes not available yet."}
+            showtimes_by_date = {}
+            for i, (date_text, date_url) in enumerate(dates):
+                if job: job.check_cancelled()
+                # The page itself already lists the first (pre-selected) date
+                times = cinemark_html.parse_showtimes(page if i == 0 else self._get(session, date_url))
+                if times: showtimes_by_date[date_text] = times
+            return showtimes_by_date if showtimes_by_date else {"Notice": "No showtimes listed for available dates."}
+        except ScrapeCancelled: raise
+        except (requests.RequestException, cinemark_html.ParseError) as e:
+            return self._fall_back(movie_url, e, 'get_specific_showtimes', movie_url, job=job, theater_url=theater_url)
+
+class QueueBackend(ScraperBackend):
+    """
+    Queues scrape jobs for the worker processes and waits for their results, so this
+    process never opens a browser. Each movie page is its own job, so adding worker
+    replicas adds showtime throughput.
+    """
+    name = 'queue'
+
+    def scrape_all_movies(self, job=None, theater_url=None):
+        scraper.report_progress(job, "Waiting for a worker to scrape the list pages...")
+        status, movies, error = job_queue.run_jobs(job_queue.LIST_JOB, [{'theater_url': theater_url or scraper.DEFAULT_THEATER_URL}], job)[0]
+        if status != 'done':
+            raise job_queue.JobFailed(f"Scraping the list pages failed: {error}")
+        return movies
+
+    def get_specific_showtimes(self, movie_url, job=None, theater_url=None):
+        if not movie_url or 'cinemark.com' not in movie_url: return {"Error": "Invalid URL"}
+        payload = {'movie_url': movie_url, 'theater_url': theater_url or scraper.DEFAULT_THEATER_URL}
+        return _job_showtimes(*job_queue.run_jobs(job_queue.SHOWTIMES_JOB, [payload], job)[0])
+
+def _job_showtimes(status, showtimes, error):
+    if status == 'done': return showtimes
+    print(f"    -> ERROR scraping showtimes on a worker: {error}")
+    return {"Error": "Could not scrape showtimes."}
+
+def create_backend(name, pool, workers):
+    selenium_backend = SeleniumBackend(pool)
+    if name == 'http':
+        return HttpBackend(workers, fallback=selenium_backend)
+    if name == 'queue':
+        return QueueBackend()
+    if name != 'selenium':
+        print(f"WARNING: Unknown SCRAPER_BACKEND '{name}', using selenium.")
+    return selenium_backend
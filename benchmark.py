@@ -0,0 +1,300 @@
+"""
+Offline end-to-end benchmark. Serves synthetic Cinemark list/movie pages and TMDB
+JSON from a local HTTP server, then drives the scraper backend, the TMDB client and
+the full perform_movie_check against catalogues of different sizes. Prints (or
+writes) one JSON document so runs can be diffed across commits.
+
+    python benchmark.py                          # 10, 100 and 1000 titles
+    python benchmark.py --titles 100 --watchlist 50 --regex 10 --output bench_output.txt
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+THEATER_ID = 'bench-theater'
+DATES_PER_MOVIE = 3
+TIMES_PER_DATE = 4
+# Every Nth title is anime by TMDB keyword
+ANIME_EVERY = 5
+ANIME_GENRE_ID = 16
+
+# --- Synthetic Site ---
+class SyntheticSite:
+    """Generates the pages and TMDB payloads for a catalogue of `titles` movies and counts requests."""
+    def __init__(self, titles, latency=0.0):
+        self.titles = [f"Bench Movie {i:04d}" for i in range(titles)]
+        self.latency = latency
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, kind):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def reset_counts(self):
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    # The backends only accept movie URLs containing "cinemark.com", so pages live under that path prefix
+    def movie_path(self, i):
+        return f"/cinemark.com/movies/bench-movie-{i:04d}"
+
+    def list_page(self, page):
+        # Titles are spread across the three list pages; release dates run from today to a year out
+        blocks = []
+        for i, title in enumerate(self.titles):
+            if i % 3 != page: continue
+            month, day = 1 + (i % 12), 1 + (i % 28)
+            blocks.append(
+                f'<div class="movieBlock" data-movie-releasedate="{month}/{day}/2027 12:00:00 AM">'
+                f'<a class="movie-poster" href="{self.movie_path(i)}"><img data-srcset="/posters/{i}.jpg"></a>'
+                f'<h3 class="title">{title}</h3></div>'
+            )
+        return f"<html><body>{''.join(blocks)}</body></html>"
+
+    def movie_page(self, i, date_index=0):
+        dates = "".join(
+            f'<a class="showdate-link" href="{self.movie_path(i)}?showDate={d}">Day {d + 1}</a>' for d in range(DATES_PER_MOVIE)
+        )
+        times = "".join(f'<a class="showtime-link">{1 + (t + date_index) % 12}:00pm</a>' for t in range(TIMES_PER_DATE))
+        return f'<html><body><div id="showdatesCarousel">{dates}</div><div id="theaterList">{times}</div></body></html>'
+
+    def tmdb_search(self, query):
+        match = re.search(r'(\d+)$', query)
+        if not match: return {'results': []}
+        i = int(match.group(1))
+        genre_ids = [ANIME_GENRE_ID] if i % ANIME_EVERY == 0 else [18]
+        return {'results': [{'id': i + 1, 'title': query, 'overview': f"Synthetic overview for {query}.", 'genre_ids': genre_ids}]}
+
+    def tmdb_keywords(self, tmdb_id):
+        keywords = [{'id': 210024, 'name': 'anime'}] if (tmdb_id - 1) % ANIME_EVERY == 0 else [{'id': 1, 'name': 'drama'}]
+        return {'id': tmdb_id, 'keywords': keywords}
+
+def _handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+
+        def _send(self, body, content_type='text/html'):
+            if site.latency: time.sleep(site.latency)
+            data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            if self.path.startswith('/cinemark.com/theaters/'):
+                self.send_header('Set-Cookie', f'theater={THEATER_ID}; Path=/')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path
+            if path.startswith('/cinemark.com/theaters/'):
+                site.count('theater'); self._send("<html><body>Theater</body></html>")
+            elif path.startswith('/cinemark.com/movies/list/'):
+                site.count('list'); self._send(site.list_page(['coming-soon', 'now-playing', 'events'].index(path.rsplit('/', 1)[-1])))
+            elif path.startswith('/cinemark.com/movies/bench-movie-'):
+                site.count('movie_page'); self._send(site.movie_page(int(path.rsplit('-', 1)[-1]), int(query.get('showDate', ['0'])[0])))
+            elif path == '/3/search/movie':
+                site.count('tmdb_search'); self._send(site.tmdb_search(query.get('query', [''])[0]), 'application/json')
+            elif path.startswith('/3/movie/') and path.endswith('/keywords'):
+                site.count('tmdb_keywords'); self._send(site.tmdb_keywords(int(path.split('/')[3])), 'application/json')
+            elif path == '/3/genre/movie/list':
+                site.count('tmdb_genres'); self._send({'genres': [{'id': ANIME_GENRE_ID, 'name': 'Animation'}, {'id': 18, 'name': 'Drama'}]}, 'application/json')
+            else:
+                self.send_error(404)
+    return Handler
+
+@contextlib.contextmanager
+def serve(site):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(site))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown(); server.server_close()
+
+# --- Measurements ---
+def _latency_stats(samples):
+    if not samples: return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'total_s': round(sum(ordered), 4),
+        'p50_s': round(statistics.median(ordered), 5),
+        'p95_s': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 5),
+        'max_s': round(ordered[-1], 5),
+    }
+
+def _git_commit():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except Exception: return None
+
+async def _timed(fn, *args):
+    start = time.perf_counter()
+    result = await fn(*args)
+    return result, time.perf_counter() - start
+
+def _make_backend(name, workers, base):
+    import backends
+    import scraper
+    scraper.COMING_SOON_URL, scraper.NOW_PLAYING_URL, scraper.EVENTS_URL = (f"{base}/cinemark.com/movies/list/{page}" for page in ('coming-soon', 'now-playing', 'events'))
+    backends.LIST_PAGES = [(scraper.COMING_SOON_URL, "Coming Soon"), (scraper.NOW_PLAYING_URL, "Now Playing"), (scraper.EVENTS_URL, "Events")]
+    if name == 'selenium':
+        from driver_pool import pool
+        return backends.SeleniumBackend(pool)
+    return backends.HttpBackend(workers, fallback=None)
+
+async def run_scenario(args, titles, watchlist, regex):
+    import database as db
+    import tmdb
+    site = SyntheticSite(titles, latency=args.latency_ms / 1000)
+    scenario = {'titles': titles, 'watchlist_entries': watchlist, 'regex_entries': regex, 'stages': {}, 'http_calls': {}}
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with serve(site) as base:
+            theater_url = f"{base}/cinemark.com/theaters/{THEATER_ID}"
+            backend = _make_backend(args.backend, args.workers, base)
+            log = io.StringIO()
+
+            # scrape_all_movies: all three list pages
+            with contextlib.redirect_stdout(log):
+                start = time.perf_counter()
+                movies = await asyncio.to_thread(backend.scrape_all_movies, None, theater_url)
+                scenario['stages']['scrape_all_movies'] = {'wall_s': round(time.perf_counter() - start, 4), 'movies': len(movies)}
+            scenario['http_calls']['scrape_all_movies'] = site.reset_counts()
+
+            # get_specific_showtimes: a sample of movie pages, one at a time for clean latencies
+            sample = movies[:args.pages]
+            latencies = []
+            with contextlib.redirect_stdout(log):
+                for movie in sample:
+                    start = time.perf_counter()
+                    await asyncio.to_thread(backend.get_specific_showtimes, movie['cinemark_url'], None, theater_url)
+                    latencies.append(time.perf_counter() - start)
+            scenario['stages']['get_specific_showtimes'] = _latency_stats(latencies)
+            scenario['http_calls']['get_specific_showtimes'] = site.reset_counts()
+
+            # TMDB details for the whole catalogue, without the database cache
+            client = tmdb.TMDBClient('bench', base_url=f"{base}/3")
+            start = time.perf_counter()
+            timed = await asyncio.gather(*(_timed(client.get_details, movie['title']) for movie in movies))
+            scenario['stages']['get_tmdb_details'] = dict(_latency_stats([elapsed for _, elapsed in timed]), wall_s=round(time.perf_counter() - start, 4))
+            scenario['http_calls']['get_tmdb_details'] = site.reset_counts()
+            await client.close()
+
+            # Full check, cold (empty database) then warm (nothing changed)
+            check = await _run_full_check(args, site, base, theater_url, backend, workdir, movies, watchlist, regex, log)
+            if check: scenario['stages'].update(check['stages']); scenario['http_calls'].update(check['http_calls'])
+            if args.verbose: print(log.getvalue())
+    finally:
+        scenario['wall_s'] = round(time.perf_counter() - started, 4)
+        scenario['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return scenario
+
+class _CountingNotifier:
+    def __init__(self): self.sent = 0
+    def notify(self, channel_id, embed, mentions=(), key=None): self.sent += 1
+
+async def _run_full_check(args, site, base, theater_url, backend, workdir, movies, watchlist, regex, log):
+    for name, value in (('BOT_TOKEN', 'bench'), ('TMDB_API_KEY', 'bench'), ('DISCORD_CHANNEL_ANIME_ID', '1'), ('DISCORD_CHANNEL_WATCHLIST_ID', '2'), ('DISCORD_CHANNEL_ALL_MOVIES_ID', '3')):
+        os.environ.setdefault(name, value)
+    try:
+        import main
+    except ImportError as e:
+        return {'stages': {'perform_movie_check': {'skipped': f"main.py could not be imported: {e}"}}, 'http_calls': {}}
+    import database as db
+    import matcher
+    import scheduler as refresh_scheduler
+    import tmdb
+
+    store = db.AsyncDatabase(os.path.join(workdir, 'bench.db'))
+    with contextlib.redirect_stdout(log):
+        await store.write(db.init_db, THEATER_ID)
+    for i, movie in enumerate(movies[:watchlist]):
+        await store.write(db.add_to_watchlist, 1000 + i % 10, movie['title'], False)
+    for i in range(regex):
+        await store.write(db.add_to_watchlist, 2000 + i % 10, rf"bench movie \d*{i % 10}{i // 10 % 10}$", True)
+    matcher.invalidate()
+
+    main.store = store
+    main.scrape_backend = backend
+    main.tmdb_client = tmdb.TMDBClient('bench', base_url=f"{base}/3")
+    main.notifications = _CountingNotifier()
+    main.THEATERS = {THEATER_ID: theater_url}
+    main.DEFAULT_THEATER = THEATER_ID
+    # No budget limit, so the cold run visits every anime/watched page like a first start would
+    main.scheduler = refresh_scheduler.RefreshScheduler(budget_per_hour=10 ** 9)
+    stages, http_calls = {}, {}
+    try:
+        for run in ('cold', 'warm'):
+            with contextlib.redirect_stdout(log):
+                start = time.perf_counter()
+                ok = await main.perform_movie_check()
+                elapsed = time.perf_counter() - start
+            stages[f'perform_movie_check_{run}'] = {'wall_s': round(elapsed, 4), 'ok': ok, 'notifications': main.notifications.sent}
+            http_calls[f'perform_movie_check_{run}'] = site.reset_counts()
+            main.notifications.sent = 0
+    finally:
+        await main.tmdb_client.close()
+        store.close()
+    return {'stages': stages, 'http_calls': http_calls}
+
+async def run_all(args):
+    results = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'backend': args.backend,
+        'workers': args.workers,
+        'latency_ms': args.latency_ms,
+        'scenarios': [],
+    }
+    for titles in args.titles:
+        watchlist = min(args.watchlist, titles)
+        print(f"Benchmarking {titles} titles ({watchlist} watchlist, {args.regex} regex entries)...", file=sys.stderr)
+        results['scenarios'].append(await run_scenario(args, titles, watchlist, args.regex))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the scrape/enrich/check pipeline.")
+    parser.add_argument('--titles', type=int, nargs='+', default=[10, 100, 1000], help="catalogue sizes to run")
+    parser.add_argument('--watchlist', type=int, default=10, help="exact-title watchlist entries (capped at the catalogue size)")
+    parser.add_argument('--regex', type=int, default=5, help="regex watchlist entries")
+    parser.add_argument('--pages', type=int, default=25, help="movie pages sampled for get_specific_showtimes latency")
+    parser.add_argument('--workers', type=int, default=4, help="parallel showtime workers")
+    parser.add_argument('--latency-ms', type=float, default=0, help="artificial server latency per response")
+    parser.add_argument('--backend', choices=['http', 'selenium'], default='http')
+    parser.add_argument('--output', help="write the JSON here instead of stdout")
+    parser.add_argument('--verbose', action='store_true', help="print the pipeline's own logging")
+    args = parser.parse_args()
+    results = asyncio.run(run_all(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f: f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+# Elements that never have children, so the tree builder must not wait for an end tag
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+class ParseError(Exception):
+    """Raised when a page doesn't have the structure the parser expects."""
+
+class Node:
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.parent = parent
+        self.children = []   # Nodes and text strings, in document order
+
+    @property
+    def classes(self):
+        return (self.attrs.get('class') or '').split()
+
+    def iter(self):
+        for child in self.children:
+            if isinstance(child, Node):
+                yield child
+                yield from child.iter()
+
+    def find_all(self, tag=None, cls=None, id=None):
+        return [
+            node for node in self.iter()
+            if (tag is None or node.tag == tag) and (cls is None or cls in node.classes) and (id is None or node.attrs.get('id') == id)
+        ]
+
+    def find(self, tag=None, cls=None, id=None):
+        matches = self.find_all(tag, cls, id)
+        return matches[0] if matches else None
+
+    def text(self):
+        """Visible text with whitespace collapsed, roughly what Selenium's .text returns on one line."""
+        parts = []
+        def walk(node):
+            for child in node.children:
+                if isinstance(child, Node):
+                    if child.tag not in ('script', 'style'): walk(child)
+                else:
+                    parts.append(child)
+        walk(self)
+        return re.sub(r'\s+', ' ', ' '.join(parts)).strip()
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node('#document', [])
+        self.current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, attrs, self.current)
+        self.current.children.append(node)
+        if tag not in VOID_TAGS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(Node(tag, attrs, self.current))
+
+    def handle_endtag(self, tag):
+        # Tolerate unclosed tags by popping up to the nearest matching ancestor
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        if data.strip():
+            self.current.children.append(data)
+
+def parse(html):
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+def parse_movie_list(html, page_url):
+    """Extracts the same movie dicts as scraper._scrape_movie_list_page from a list page's HTML."""
+    movies_data = []
+    for block in parse(html).find_all(cls='movieBlock'):
+        try:
+            title = block.find(cls='title').text()
+            release_date_str = block.attrs.get('data-movie-releasedate')
+            poster_link = block.find(cls='movie-poster')
+            movie_url = urljoin(page_url, poster_link.attrs['href'])
+            poster_img = poster_link.find(tag='img')
+            poster_url = poster_img.attrs.get('data-srcset') or poster_img.attrs.get('src')
+            try: formatted_date = datetime.strptime(release_date_str, '%m/%d/%Y %I:%M:%S %p').strftime('%Y-%m-%d')
+            except (ValueError, TypeError): formatted_date = "N/A"
+            if title: movies_data.append({'title': title, 'release_date': formatted_date, 'cinemark_url': movie_url, 'poster_url': poster_url})
+        except (AttributeError, KeyError): continue
+    return movies_data
+
+def parse_show_dates(html, page_url):
+    """
+    Returns [(date_label, url), ...] for the movie page's date carousel, or [] when the
+    carousel is present but empty. Raises ParseError if there is no carousel at all,
+    since that usually means it is rendered client-side.
+    """
+    carousel = parse(html).find(id='showdatesCarousel')
+    if carousel is None:
+        raise ParseError("No #showdatesCarousel on movie page.")
+    dates = []
+    for link in carousel.find_all(cls='showdate-link'):
+        href = link.attrs.get('href') or ''
+        if not href or href.startswith(('#', 'javascript:')):
+            raise ParseError("Show date links are not plain URLs.")
+        dates.append((link.text(), urljoin(page_url, href)))
+    return dates
+
+def parse_showtimes(html):
+    """Returns the sorted, de-duplicated showtimes listed in #theaterList."""
+    theater_list = parse(html).find(id='theaterList')
+    if theater_list is None:
+        return []
+    return sorted({link.text() for link in theater_list.find_all(cls='showtime-link') if link.text()})
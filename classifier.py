@@ -0,0 +1,100 @@
+import hashlib
+import json
+import re
+import os
+from collections import namedtuple
+import database as db
+
+# Studio/distributor names, title regexes and title-cleaning keywords; a custom file only
+# needs the keys it changes, the rest come from the bundled anime_rules.json
+BUNDLED_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anime_rules.json')
+ANIME_RULES_FILE = os.getenv('ANIME_RULES_FILE') or BUNDLED_RULES_FILE
+RULE_KINDS = [('studios', 'studio'), ('distributors', 'distributor'), ('title_patterns', 'pattern')]
+
+# cleaned_title is what TMDB is searched for; rule names the rule that fired, e.g. "studio:madhouse"
+Verdict = namedtuple('Verdict', 'cleaned_title is_anime rule')
+
+def load_rules(path=ANIME_RULES_FILE):
+    """Reads a rules file over the bundled defaults. Raises ValueError if it is unusable."""
+    try:
+        with open(BUNDLED_RULES_FILE) as f: rules = json.load(f)
+        if path != BUNDLED_RULES_FILE:
+            with open(path) as f: rules.update(json.load(f))
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Could not load anime rules from {path}: {e}")
+    for pattern in rules['title_patterns']:
+        try: re.compile(pattern)
+        except re.error as e: raise ValueError(f"Invalid anime title pattern {pattern!r} in {path}: {e}")
+    return rules
+
+def _any_of(words):
+    return '|'.join(re.escape(word) for word in words)
+
+class AnimeClassifier:
+    """
+    Title rules compiled once. All studio and distributor names form one alternation,
+    matched against the lowercased title in a single scan, and all title patterns form
+    another (sre optimizes a pure-literal alternation far better than one mixed with
+    regex rules). Only titles that match look up which rule fired.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.version = hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()
+        self._literal_rules = {}
+        for key, label in RULE_KINDS[:2]:
+            for rule in rules[key]: self._literal_rules.setdefault(rule.lower(), f"{label}:{rule}")
+        # Longest names first, so a name that contains another one is reported as itself
+        literals = sorted(self._literal_rules, key=len, reverse=True)
+        self._literals = re.compile('|'.join(re.escape(literal) for literal in literals)) if literals else None
+        # Patterns see the lowercased title too, so they are written in lowercase (IGNORECASE would also slow sre down)
+        self._patterns = [(re.compile(pattern), f"pattern:{pattern}") for pattern in rules['title_patterns']]
+        self._any_pattern = re.compile('|'.join(f"(?:{pattern})" for pattern in rules['title_patterns'])) if self._patterns else None
+        self._parenthetical = re.compile(r'\s*\(.*\)')
+        self._format_tags = re.compile(rf"\s+({_any_of(rules['format_tags'])})\b", re.IGNORECASE)
+        self._edition = re.compile(_any_of(rules['edition_keywords']), re.IGNORECASE)
+        self._event = re.compile(_any_of(rules['event_keywords']), re.IGNORECASE)
+
+    def clean_title(self, title):
+        """Clean movie title for TMDB search, removing format indicators and event suffixes."""
+        cleaned = self._parenthetical.sub('', title).strip()
+        # Remove quality indicators like "4K", "IMAX", "3D", etc.
+        if self.rules['format_tags']: cleaned = self._format_tags.sub('', cleaned).strip()
+        if ':' in cleaned and self.rules['edition_keywords']:
+            base, edition = cleaned.split(':', 1)
+            if self._edition.search(edition): return base.strip()
+        if '|' in cleaned and self.rules['event_keywords']:
+            base, event = cleaned.split('|', 1)
+            if self._event.search(event): return base.strip()
+        return cleaned
+
+    def match(self, title):
+        """Returns the name of the rule that marks `title` as anime, or None."""
+        lowered = title.lower()
+        found = self._literals.search(lowered) if self._literals else None
+        if found: return self._literal_rules[found.group()]
+        if self._any_pattern and self._any_pattern.search(lowered):
+            return next(name for pattern, name in self._patterns if pattern.search(lowered))
+        return None
+
+    def classify(self, title):
+        rule = self.match(title)
+        return Verdict(self.clean_title(title), rule is not None, rule)
+
+    def classify_batch(self, titles):
+        """Classifies a whole batch of titles, each distinct title once. Returns {title: Verdict}."""
+        return {title: self.classify(title) for title in dict.fromkeys(titles)}
+
+engine = AnimeClassifier(load_rules())
+
+def classify_titles(conn, titles, classifier=None):
+    """
+    Memoized classification: verdicts stored under the current rules version are reused,
+    the rest are classified in one batch and stored. Returns ({title: Verdict}, set of
+    titles that were (re)classified now, i.e. new titles or titles from before a rule change).
+    """
+    classifier = classifier or engine
+    verdicts = {title: Verdict(*values) for title, values in db.get_title_classifications(conn, titles, classifier.version).items()}
+    fresh = classifier.classify_batch(title for title in titles if title not in verdicts)
+    if fresh: db.save_title_classifications(conn, fresh, classifier.version)
+    verdicts.update(fresh)
+    return verdicts, set(fresh)
@@ -1,18 +1,117 @@
 import sqlite3
-import re
+import asyncio
+import threading
+import json
+import time
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import metrics
 
-DATABASE_FILE = 'movies.db'
+# Point this into a mounted directory when several containers share the database, so they
+# also share its WAL files
+DATABASE_FILE = os.getenv('DATABASE_FILE') or 'movies.db'
+DB_READERS = int(os.getenv('DB_READERS') or 2)
+# Check runs kept in the runs table for /stats
+RUNS_KEPT = int(os.getenv('RUNS_KEPT') or 500)
+# WAL lets readers keep going while the check writes; NORMAL sync is safe under WAL
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+]
 
-def get_connection():
+def get_connection(path=None, check_same_thread=True):
     """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_FILE)
+    conn = sqlite3.connect(path or DATABASE_FILE, cached_statements=256, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
-    """Creates the necessary tables if they don't already exist."""
-    conn = get_connection()
+class AsyncDatabase:
+    """
+    Long-lived database access for the event loop. One writer connection lives on a
+    dedicated thread and a few reader connections on their own threads; every call
+    runs there, so the loop never blocks on disk I/O and (thanks to WAL) readers
+    never wait on the writer. Functions take the connection as their first argument,
+    matching the table functions below, e.g. `await store.read(get_movie, title)`.
+    """
+    def __init__(self, path=DATABASE_FILE, readers=DB_READERS):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Only ever used on this thread; closed from the caller's thread at shutdown
+            conn = self._local.conn = get_connection(self.path, check_same_thread=False)
+            with self._lock: self._connections.append(conn)
+        return conn
+
+    def _call(self, stage, fn, args):
+        # Timed on the database thread, so queueing behind other calls isn't counted
+        with metrics.timer(stage):
+            return fn(self._conn(), *args)
+
+    async def read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, self._call, 'db_read', fn, args)
+
+    async def write(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self._call, 'db_write', fn, args)
+
+    def close(self):
+        self._writer.shutdown(wait=True); self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections: conn.close()
+            self._connections = []
+
+# Stored in PRAGMA user_version once init_db has brought a database up to date. Every
+# step in init_db is idempotent; bump this when adding one so existing databases run it.
+SCHEMA_VERSION = 2
+
+SHOWTIME_SNAPSHOTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS showtime_snapshots (
+        theater TEXT NOT NULL,
+        title TEXT NOT NULL,
+        showtimes TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY(theater, title)
+    )
+'''
+SHOWTIMES_SQL = '''
+    CREATE TABLE IF NOT EXISTS showtimes (
+        theater TEXT NOT NULL,
+        title TEXT NOT NULL,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        PRIMARY KEY(theater, title, date, time)
+    )
+'''
+
+def init_db(conn=None, default_theater=''):
+    """
+    Creates the necessary tables if they don't already exist. Showtime data from
+    before multi-theater support is assigned to `default_theater`. A database already
+    at SCHEMA_VERSION (PRAGMA user_version) is left alone.
+    """
+    own_conn = conn is None
+    conn = conn or get_connection()
     cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        if own_conn: conn.close()
+        print(f"Database schema is up to date (version {version}).")
+        return
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS movies (
             title TEXT PRIMARY KEY, release_date TEXT, cinemark_url TEXT,
@@ -35,6 +134,63 @@ def init_db():
             PRIMARY KEY(user_id, pattern)
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tmdb_search_cache (
+            cleaned_title TEXT PRIMARY KEY,
+            tmdb_id INTEGER,
+            result TEXT,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tmdb_keyword_cache (
+            tmdb_id INTEGER PRIMARY KEY,
+            keywords TEXT NOT NULL,
+            is_anime INTEGER NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tmdb_genres (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute(SHOWTIME_SNAPSHOTS_SQL)
+    cursor.execute(SHOWTIMES_SQL)
+    # Per-theater showtime state of each catalogue movie
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS theater_movies (
+            theater TEXT NOT NULL,
+            title TEXT NOT NULL,
+            showtimes TEXT,
+            showtimes_digest TEXT,
+            showtimes_checked_at REAL,
+            PRIMARY KEY(theater, title)
+        )
+    ''')
+    
+    # Migration: Key showtimes and snapshots by theater
+    _add_theater_key(cursor, 'showtime_snapshots', SHOWTIME_SNAPSHOTS_SQL, ['title', 'showtimes', 'fetched_at'], default_theater)
+    _add_theater_key(cursor, 'showtimes', SHOWTIMES_SQL, ['title', 'date', 'time', 'first_seen', 'last_seen'], default_theater)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_showtimes_title_last_seen ON showtimes(theater, title, last_seen)")
+    # Only served the removed get_new_showtimes_since; it slowed every showtime upsert
+    cursor.execute("DROP INDEX IF EXISTS idx_showtimes_first_seen")
+    
+    # Migration: Seed the normalized showtimes table from the legacy comma-joined
+    # movies.showtimes strings. Times were never stored, so each known date gets a
+    # placeholder row with an empty time; that's enough to stop it being reported as new.
+    cursor.execute("SELECT 1 FROM showtimes LIMIT 1")
+    if cursor.fetchone() is None:
+        cursor.execute("SELECT title, showtimes FROM movies WHERE showtimes IS NOT NULL AND showtimes != ''")
+        now = time.time()
+        legacy_rows = [
+            (default_theater, row['title'], date.strip(), '', now, now)
+            for row in cursor.fetchall() if "not listed" not in row['showtimes']
+            for date in row['showtimes'].split(',') if date.strip()
+        ]
+        cursor.executemany("INSERT OR IGNORE INTO showtimes (theater, title, date, time, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)", legacy_rows)
     
     # Migration: Add is_regex column to ignore_list if it doesn't exist
     cursor.execute("PRAGMA table_info(ignore_list)")
@@ -44,9 +200,90 @@ def init_db():
         # Rename movie_title column to pattern for consistency
         cursor.execute("ALTER TABLE ignore_list RENAME COLUMN movie_title TO pattern")
     
+    # Migration: Fingerprints for incremental checks
+    _add_column_if_missing(cursor, 'movies', 'list_fingerprint', 'TEXT')
+    _add_column_if_missing(cursor, 'movies', 'showtimes_digest', 'TEXT')
+    _add_column_if_missing(cursor, 'movies', 'showtimes_checked_at', 'REAL')
+    
+    # Migration: movies.showtimes/showtimes_digest/showtimes_checked_at were single-theater;
+    # they now live in theater_movies, seeded once for the default theater
+    cursor.execute("SELECT 1 FROM theater_movies LIMIT 1")
+    if cursor.fetchone() is None:
+        cursor.execute('''
+            INSERT INTO theater_movies (theater, title, showtimes, showtimes_digest, showtimes_checked_at)
+            SELECT ?, title, showtimes, showtimes_digest, showtimes_checked_at FROM movies
+        ''', (default_theater,))
+    
+    # Migration: Optional theater filter on watchlist entries (NULL = any theater)
+    _add_column_if_missing(cursor, 'watchlist', 'theater', 'TEXT')
+
+    # One row per check for /stats; stages and counters are JSON from metrics.Run
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            duration REAL NOT NULL,
+            success INTEGER NOT NULL,
+            movies INTEGER NOT NULL DEFAULT 0,
+            pages INTEGER NOT NULL DEFAULT 0,
+            notifications INTEGER NOT NULL DEFAULT 0,
+            stages TEXT NOT NULL,
+            counters TEXT NOT NULL
+        )
+    ''')
+
+    # Memoized title classifications (see classifier.py), valid while rules_version matches
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS title_classifications (
+            title TEXT PRIMARY KEY,
+            cleaned_title TEXT NOT NULL,
+            is_anime INTEGER NOT NULL,
+            rule TEXT,
+            rules_version TEXT NOT NULL,
+            classified_at REAL NOT NULL
+        )
+    ''')
+
+    # Durable job queue between the bot and scrape workers (see job_queue.py and worker.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            worker TEXT,
+            lease_until REAL,
+            available_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, available_at)")
+
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
+    if own_conn: conn.close()
+    print(f"Database initialized successfully (schema version {SCHEMA_VERSION}).")
+
+def _add_column_if_missing(cursor, table, column, declaration):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+def _add_theater_key(cursor, table, create_sql, columns, default_theater):
+    # SQLite can't change a primary key in place, so the table is rebuilt with theater in front
+    cursor.execute(f"PRAGMA table_info({table})")
+    if 'theater' in [row[1] for row in cursor.fetchall()]: return
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    cursor.execute(create_sql)
+    column_list = ', '.join(columns)
+    cursor.execute(f"INSERT INTO {table} (theater, {column_list}) SELECT ?, {column_list} FROM {table}_legacy", (default_theater,))
+    cursor.execute(f"DROP TABLE {table}_legacy")
 
 # --- Movie Table Functions (Unchanged) ---
 def get_movie(conn, title):
@@ -54,33 +291,165 @@ def get_movie(conn, title):
     cursor.execute("SELECT * FROM movies WHERE title = ?", (title,))
     return cursor.fetchone()
 
-def add_or_update_movie(conn, movie, showtimes_str, is_anime_flag, overview):
+def get_movies(conn, titles):
+    """Returns {title: row} for the given titles that are in the database."""
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO movies (title, release_date, cinemark_url, poster_url, is_anime, showtimes, overview)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(title) DO UPDATE SET
-            release_date=excluded.release_date, cinemark_url=excluded.cinemark_url,
-            poster_url=excluded.poster_url, is_anime=excluded.is_anime,
-            showtimes=excluded.showtimes, overview=excluded.overview
-    ''', (movie['title'], movie['release_date'], movie['cinemark_url'], movie['poster_url'], is_anime_flag, showtimes_str, overview))
-    conn.commit()
+    rows = {}
+    titles = list(titles)
+    # Stay well under SQLite's bound-parameter limit
+    for i in range(0, len(titles), 500):
+        chunk = titles[i:i + 500]
+        cursor.execute(f"SELECT * FROM movies WHERE title IN ({', '.join('?' * len(chunk))})", chunk)
+        rows.update((row['title'], row) for row in cursor.fetchall())
+    return rows
+
+def list_fingerprint(movie):
+    """Hash of the attributes a list page shows for a movie; changes when the listing does."""
+    fields = [movie.get(key) or '' for key in ('title', 'release_date', 'cinemark_url', 'poster_url')]
+    return hashlib.sha1('\x1f'.join(fields).encode()).hexdigest()
+
+def showtimes_digest(showtimes_dict):
+    return hashlib.sha1(json.dumps(showtimes_dict, sort_keys=True).encode()).hexdigest()
 
-def update_showtimes(conn, title, new_showtimes_str):
+UPSERT_MOVIE_SQL = '''
+    INSERT INTO movies (title, release_date, cinemark_url, poster_url, is_anime, overview)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(title) DO UPDATE SET
+        release_date=excluded.release_date, cinemark_url=excluded.cinemark_url,
+        poster_url=excluded.poster_url, is_anime=excluded.is_anime, overview=excluded.overview
+'''
+
+# --- Per-Theater Movie State Functions ---
+UPSERT_THEATER_SHOWTIMES_SQL = '''
+    INSERT INTO theater_movies (theater, title, showtimes) VALUES (?, ?, ?)
+    ON CONFLICT(theater, title) DO UPDATE SET showtimes=excluded.showtimes
+'''
+UPSERT_THEATER_DIGEST_SQL = '''
+    INSERT INTO theater_movies (theater, title, showtimes_digest, showtimes_checked_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(theater, title) DO UPDATE SET
+        showtimes_digest=excluded.showtimes_digest, showtimes_checked_at=excluded.showtimes_checked_at
+'''
+
+def get_theater_movies(conn, theater, titles):
+    """Returns {title: row} of the showtime state at one theater for the given titles."""
     cursor = conn.cursor()
-    cursor.execute("UPDATE movies SET showtimes = ? WHERE title = ?", (new_showtimes_str, title))
-    conn.commit()
+    rows = {}
+    titles = list(titles)
+    for i in range(0, len(titles), 500):
+        chunk = titles[i:i + 500]
+        cursor.execute(f"SELECT * FROM theater_movies WHERE theater = ? AND title IN ({', '.join('?' * len(chunk))})", [theater] + chunk)
+        rows.update((row['title'], row) for row in cursor.fetchall())
+    return rows
 
 def get_all_movie_titles(conn):
     cursor = conn.cursor()
     cursor.execute("SELECT title FROM movies ORDER BY title ASC")
     return [row['title'] for row in cursor.fetchall()]
 
+# --- Normalized Showtimes Functions ---
+UPSERT_SHOWTIME_SQL = '''
+    INSERT INTO showtimes (theater, title, date, time, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(theater, title, date, time) DO UPDATE SET last_seen=excluded.last_seen
+'''
+
+def diff_showtimes(conn, theater, title, showtimes_dict):
+    """
+    Compares a scrape's {date: [times]} with everything recorded for the title at the theater and
+    returns (new_dates, new_times): dates with no earlier row, and (date, time)
+    pairs never seen before. Read-only; the scrape is passed in as a VALUES list
+    so the set difference runs entirely in SQL.
+    """
+    pairs = [(date, t) for date, times in showtimes_dict.items() for t in times]
+    if not pairs: return [], []
+    scraped = f"WITH scraped(date, time) AS (VALUES {', '.join(['(?, ?)'] * len(pairs))})"
+    params = [value for pair in pairs for value in pair]
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        {scraped}
+        SELECT DISTINCT s.date FROM scraped s
+        WHERE NOT EXISTS (SELECT 1 FROM showtimes t WHERE t.theater = ? AND t.title = ? AND t.date = s.date)
+    ''', params + [theater, title])
+    new_dates = [row['date'] for row in cursor.fetchall()]
+    cursor.execute(f'''
+        {scraped}
+        SELECT s.date, s.time FROM scraped s
+        LEFT JOIN showtimes t ON t.theater = ? AND t.title = ? AND t.date = s.date AND t.time = s.time
+        WHERE t.title IS NULL
+    ''', params + [theater, title])
+    new_times = [(row['date'], row['time']) for row in cursor.fetchall()]
+    return new_dates, new_times
+
+# --- Showtime Snapshot Functions ---
+def get_showtime_snapshot(conn, theater, title):
+    """Returns (showtimes_dict, fetched_at) for the last scrape of a movie at a theater, or None."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT showtimes, fetched_at FROM showtime_snapshots WHERE theater = ? AND title = ?", (theater, title))
+    row = cursor.fetchone()
+    return (json.loads(row['showtimes']), row['fetched_at']) if row else None
+
+UPSERT_SNAPSHOT_SQL = '''
+    INSERT INTO showtime_snapshots (theater, title, showtimes, fetched_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(theater, title) DO UPDATE SET showtimes=excluded.showtimes, fetched_at=excluded.fetched_at
+'''
+
+def save_showtime_snapshot(conn, theater, title, showtimes_dict, fetched_at=None):
+    cursor = conn.cursor()
+    cursor.execute(UPSERT_SNAPSHOT_SQL, (theater, title, json.dumps(showtimes_dict), fetched_at or time.time()))
+    conn.commit()
+
+# --- Check Batch Functions ---
+class CheckBatch:
+    """
+    Writes staged during a check run. Nothing touches the database until
+    apply_check_batch, which writes everything in a single transaction.
+    """
+    def __init__(self):
+        self.movies = []
+        self.list_fingerprints = []
+        self.showtime_strings = []
+        self.showtime_rows = []
+        self.snapshots = []
+        self.digests = []
+
+    def __len__(self):
+        return sum(len(rows) for rows in (self.movies, self.list_fingerprints, self.showtime_strings, self.showtime_rows, self.snapshots, self.digests))
+
+    def add_or_update_movie(self, movie, is_anime_flag, overview):
+        self.movies.append((movie['title'], movie['release_date'], movie['cinemark_url'], movie['poster_url'], is_anime_flag, overview))
+
+    def set_list_fingerprint(self, title, list_fingerprint):
+        self.list_fingerprints.append((list_fingerprint, title))
+
+    def update_showtimes(self, theater, title, new_showtimes_str):
+        self.showtime_strings.append((theater, title, new_showtimes_str))
+
+    def record_showtimes(self, theater, title, showtimes_dict, seen_at=None):
+        seen_at = seen_at or time.time()
+        self.showtime_rows += [(theater, title, date, t, seen_at, seen_at) for date, times in showtimes_dict.items() for t in times]
+
+    def save_showtime_snapshot(self, theater, title, showtimes_dict, fetched_at=None):
+        self.snapshots.append((theater, title, json.dumps(showtimes_dict), fetched_at or time.time()))
+
+    def set_showtimes_digest(self, theater, title, showtimes_digest, checked_at=None):
+        """Records that the movie page was visited at this theater, and what it showed."""
+        self.digests.append((theater, title, showtimes_digest, checked_at or time.time()))
+
+def apply_check_batch(conn, batch):
+    """Applies a CheckBatch with executemany in one transaction (one fsync); rolls back on error."""
+    with conn:
+        cursor = conn.cursor()
+        cursor.executemany(UPSERT_MOVIE_SQL, batch.movies)
+        cursor.executemany("UPDATE movies SET list_fingerprint = ? WHERE title = ?", batch.list_fingerprints)
+        cursor.executemany(UPSERT_THEATER_SHOWTIMES_SQL, batch.showtime_strings)
+        cursor.executemany(UPSERT_SHOWTIME_SQL, batch.showtime_rows)
+        cursor.executemany(UPSERT_SNAPSHOT_SQL, batch.snapshots)
+        cursor.executemany(UPSERT_THEATER_DIGEST_SQL, batch.digests)
+
 # --- Watchlist Table Functions (Unchanged) ---
-def add_to_watchlist(conn, user_id, pattern, is_regex=False):
+def add_to_watchlist(conn, user_id, pattern, is_regex=False, theater=None):
     cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO watchlist (user_id, pattern, is_regex) VALUES (?, ?, ?)", (user_id, pattern, 1 if is_regex else 0))
+        cursor.execute("INSERT INTO watchlist (user_id, pattern, is_regex, theater) VALUES (?, ?, ?, ?)", (user_id, pattern, 1 if is_regex else 0, theater))
         conn.commit()
         return True
     except sqlite3.IntegrityError: return False
@@ -93,23 +462,13 @@ def remove_from_watchlist(conn, user_id, pattern):
 
 def get_user_watchlist(conn, user_id):
     cursor = conn.cursor()
-    cursor.execute("SELECT pattern, is_regex FROM watchlist WHERE user_id = ?", (user_id,))
+    cursor.execute("SELECT pattern, is_regex, theater FROM watchlist WHERE user_id = ?", (user_id,))
     return cursor.fetchall()
 
-def get_watchers_for_movie(conn, movie_title):
-    watchers = set()
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM watchlist WHERE pattern = ? AND is_regex = 0", (movie_title,))
-    for row in cursor.fetchall():
-        watchers.add(row['user_id'])
-    cursor.execute("SELECT user_id, pattern FROM watchlist WHERE is_regex = 1")
-    for row in cursor.fetchall():
-        try:
-            if re.search(row['pattern'], movie_title, re.IGNORECASE):
-                watchers.add(row['user_id'])
-        except re.error:
-            continue
-    return list(watchers)
+def get_all_watchlist_entries(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, pattern, is_regex, theater FROM watchlist")
+    return cursor.fetchall()
 
 # --- Ignore List Functions ---
 def add_to_ignore_list(conn, user_id, pattern, is_regex=False):
@@ -131,22 +490,239 @@ def get_user_ignore_list(conn, user_id):
     cursor.execute("SELECT pattern, is_regex FROM ignore_list WHERE user_id = ?", (user_id,))
     return cursor.fetchall()
 
-def is_movie_ignored_by_any_user(conn, movie_title):
-    """Checks if a movie is ignored by ANY user (including regex patterns)."""
+def get_all_ignore_entries(conn):
     cursor = conn.cursor()
-    
-    # Check exact title matches
-    cursor.execute("SELECT 1 FROM ignore_list WHERE pattern = ? AND is_regex = 0", (movie_title,))
-    if cursor.fetchone():
-        return True
-    
-    # Check regex patterns
-    cursor.execute("SELECT pattern FROM ignore_list WHERE is_regex = 1")
-    for row in cursor.fetchall():
-        try:
-            if re.search(row['pattern'], movie_title, re.IGNORECASE):
-                return True
-        except re.error:
-            continue
-    
-    return False
+    cursor.execute("SELECT user_id, pattern, is_regex FROM ignore_list")
+    return cursor.fetchall()
+
+# --- TMDB Cache Functions ---
+def get_cached_tmdb_search(conn, cleaned_title, max_age, negative_max_age):
+    """
+    Returns (hit, result) for a cached TMDB search. A hit with result None is a
+    cached "no results" entry, which expires after negative_max_age seconds.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT result, fetched_at FROM tmdb_search_cache WHERE cleaned_title = ?", (cleaned_title,))
+    row = cursor.fetchone()
+    if row is None:
+        return False, None
+    age = time.time() - row['fetched_at']
+    if row['result'] is None:
+        return (age < negative_max_age), None
+    if age >= max_age:
+        return False, None
+    return True, json.loads(row['result'])
+
+def cache_tmdb_search(conn, cleaned_title, result):
+    """Stores the top TMDB search result for a title, or None for no results."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO tmdb_search_cache (cleaned_title, tmdb_id, result, fetched_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(cleaned_title) DO UPDATE SET
+            tmdb_id=excluded.tmdb_id, result=excluded.result, fetched_at=excluded.fetched_at
+    ''', (cleaned_title, result.get('id') if result else None, json.dumps(result) if result else None, time.time()))
+    conn.commit()
+
+def get_cached_tmdb_keywords(conn, tmdb_id, max_age):
+    """Returns the cached anime-keyword verdict for a TMDB id, or None if missing or expired."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT is_anime, fetched_at FROM tmdb_keyword_cache WHERE tmdb_id = ?", (tmdb_id,))
+    row = cursor.fetchone()
+    if row is None or time.time() - row['fetched_at'] >= max_age:
+        return None
+    return bool(row['is_anime'])
+
+def cache_tmdb_keywords(conn, tmdb_id, keywords, is_anime):
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO tmdb_keyword_cache (tmdb_id, keywords, is_anime, fetched_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(tmdb_id) DO UPDATE SET
+            keywords=excluded.keywords, is_anime=excluded.is_anime, fetched_at=excluded.fetched_at
+    ''', (tmdb_id, json.dumps(keywords), 1 if is_anime else 0, time.time()))
+    conn.commit()
+
+def get_cached_genres(conn, max_age):
+    """Returns the cached {genre_id: name} map, or None if it is missing or expired."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name, fetched_at FROM tmdb_genres")
+    rows = cursor.fetchall()
+    if not rows or time.time() - min(row['fetched_at'] for row in rows) >= max_age:
+        return None
+    return {row['id']: row['name'] for row in rows}
+
+def cache_genres(conn, genre_map):
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.execute("DELETE FROM tmdb_genres")
+    cursor.executemany("INSERT INTO tmdb_genres (id, name, fetched_at) VALUES (?, ?, ?)",
+                       [(genre_id, name, now) for genre_id, name in genre_map.items()])
+    conn.commit()
+
+# --- Title Classification Functions ---
+def get_title_classifications(conn, titles, rules_version):
+    """Returns {title: (cleaned_title, is_anime, rule)} for titles classified under `rules_version`."""
+    cursor = conn.cursor()
+    verdicts = {}
+    titles = list(titles)
+    for start in range(0, len(titles), 500):
+        chunk = titles[start:start + 500]
+        cursor.execute(f'''
+            SELECT title, cleaned_title, is_anime, rule FROM title_classifications
+            WHERE rules_version = ? AND title IN ({','.join('?' * len(chunk))})
+        ''', (rules_version, *chunk))
+        for row in cursor.fetchall():
+            verdicts[row['title']] = (row['cleaned_title'], bool(row['is_anime']), row['rule'])
+    return verdicts
+
+def save_title_classifications(conn, verdicts, rules_version):
+    """Stores {title: (cleaned_title, is_anime, rule)}, replacing verdicts from older rules."""
+    now = time.time()
+    with conn:
+        conn.executemany('''
+            INSERT INTO title_classifications (title, cleaned_title, is_anime, rule, rules_version, classified_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(title) DO UPDATE SET
+                cleaned_title=excluded.cleaned_title, is_anime=excluded.is_anime, rule=excluded.rule,
+                rules_version=excluded.rules_version, classified_at=excluded.classified_at
+        ''', [(title, cleaned, 1 if is_anime else 0, rule, rules_version, now) for title, (cleaned, is_anime, rule) in verdicts.items()])
+
+# --- Run History Functions ---
+def record_run(conn, run):
+    """Stores a finished metrics.Run dict and prunes all but the newest RUNS_KEPT runs."""
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO runs (kind, started_at, duration, success, movies, pages, notifications, stages, counters)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (run['kind'], run['started_at'], run['duration'], 1 if run['success'] else 0, run.get('movies', 0),
+              run.get('pages', 0), run.get('notifications', 0), json.dumps(run['stages']), json.dumps(run['counters'])))
+        conn.execute("DELETE FROM runs WHERE id <= ?", (cursor.lastrowid - RUNS_KEPT,))
+
+def get_last_list_poll(conn):
+    """When the newest successful check that polled the list pages finished, or None."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(started_at + duration) FROM runs WHERE success = 1 AND kind IN ('list', 'full')")
+    return cursor.fetchone()[0]
+
+def get_refresh_states(conn):
+    """
+    Rows (theater, title, release_date, is_anime, showtimes_checked_at) for every movie
+    page visited before, to rebuild the refresh schedule after a restart.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT t.theater, t.title, m.release_date, m.is_anime, t.showtimes_checked_at
+        FROM theater_movies t JOIN movies m ON m.title = t.title
+        WHERE t.showtimes_checked_at IS NOT NULL
+    ''')
+    return cursor.fetchall()
+
+def get_recent_runs(conn, limit):
+    """Returns the newest `limit` runs, newest first, with stages and counters decoded."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM runs ORDER BY id DESC LIMIT ?", (limit,))
+    return [dict(row, stages=json.loads(row['stages']), counters=json.loads(row['counters'])) for row in cursor.fetchall()]
+
+# --- Job Queue Functions ---
+# Jobs go queued -> running (leased by one worker) -> done/failed. A running job whose
+# lease runs out (the worker died or hung) is claimable again while it has attempts left.
+FINISHED_JOBS_KEPT = 24 * 3600
+
+def enqueue_jobs(conn, kind, payloads, max_attempts):
+    """Queues one job per payload and returns their ids, in order."""
+    now = time.time()
+    with conn:
+        # Results nobody collected (e.g. the bot restarted mid-check) are dropped after a day
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (now - FINISHED_JOBS_KEPT,))
+        return [
+            conn.execute(
+                "INSERT INTO jobs (kind, payload, max_attempts, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), max_attempts, now, now, now)
+            ).lastrowid
+            for payload in payloads
+        ]
+
+def claim_job(conn, worker, kinds, lease_seconds):
+    """
+    Leases the oldest runnable job of one of `kinds` to `worker`. Returns the job row
+    (payload decoded) or None. BEGIN IMMEDIATE makes claiming atomic across processes.
+    """
+    now = time.time()
+    placeholders = ','.join('?' * len(kinds))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute('''
+            UPDATE jobs SET status = 'failed', error = 'Worker lease expired on the last attempt.', worker = NULL, updated_at = ?
+            WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts
+        ''', (now, now))
+        row = conn.execute(f'''
+            SELECT id FROM jobs WHERE kind IN ({placeholders})
+            AND ((status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?))
+            ORDER BY id LIMIT 1
+        ''', (*kinds, now, now)).fetchone()
+        if row is not None:
+            conn.execute('''
+                UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_until = ?, updated_at = ?
+                WHERE id = ?
+            ''', (worker, now + lease_seconds, now, row['id']))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if row is None: return None
+    job = dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone())
+    job['payload'] = json.loads(job['payload'])
+    return job
+
+def heartbeat_jobs(conn, worker, job_ids, lease_seconds):
+    """Extends the worker's leases. Returns the ids it still holds; the rest were lost or cancelled."""
+    if not job_ids: return set()
+    now = time.time()
+    placeholders = ','.join('?' * len(job_ids))
+    with conn:
+        conn.execute(f"UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id IN ({placeholders}) AND worker = ? AND status = 'running'",
+                     (now + lease_seconds, now, *job_ids, worker))
+    cursor = conn.execute(f"SELECT id FROM jobs WHERE id IN ({placeholders}) AND worker = ? AND status = 'running'", (*job_ids, worker))
+    return {row['id'] for row in cursor.fetchall()}
+
+def complete_job(conn, job_id, worker, result):
+    """Stores a job's result. Returns False if the worker no longer held the job."""
+    with conn:
+        cursor = conn.execute('''
+            UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL, updated_at = ?
+            WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (json.dumps(result), time.time(), job_id, worker))
+    return cursor.rowcount > 0
+
+def fail_job(conn, job_id, worker, error, retry_delay):
+    """Requeues a failed attempt after `retry_delay` seconds, or fails the job once its attempts are used up."""
+    now = time.time()
+    with conn:
+        conn.execute('''
+            UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                error = ?, worker = NULL, lease_until = NULL, available_at = ?, updated_at = ?
+            WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (error, now + retry_delay, now, job_id, worker))
+
+def get_finished_jobs(conn, job_ids):
+    """Returns {id: (status, result, error)} for the given jobs that are done or failed."""
+    finished = {}
+    job_ids = list(job_ids)
+    for start in range(0, len(job_ids), 500):
+        chunk = job_ids[start:start + 500]
+        cursor = conn.execute(f"SELECT id, status, result, error FROM jobs WHERE id IN ({','.join('?' * len(chunk))}) AND status IN ('done', 'failed')", chunk)
+        for row in cursor.fetchall():
+            finished[row['id']] = (row['status'], json.loads(row['result']) if row['result'] else None, row['error'])
+    return finished
+
+def delete_jobs(conn, job_ids):
+    """Removes consumed jobs; deleting an unfinished one cancels it (its worker loses the lease)."""
+    job_ids = list(job_ids)
+    with conn:
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            conn.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+def get_job_counts(conn):
+    """Returns {status: count} over the whole queue."""
+    cursor = conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+    return {row['status']: row['count'] for row in cursor.fetchall()}
@@ -0,0 +1,129 @@
+import threading
+import os
+from collections import deque
+from contextlib import contextmanager
+import metrics
+
+# selenium and webdriver_manager are imported when the first browser is needed, so
+# processes that never open one (http/queue backends, a bot answering commands) start faster
+
+DRIVER_POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE') or 2)
+# Recycle a browser after this many page loads to keep Chrome's memory in check
+DRIVER_MAX_PAGES = int(os.getenv('DRIVER_MAX_PAGES') or 200)
+
+class PooledDriver:
+    """
+    Proxy around a Chrome WebDriver that counts page loads and remembers which
+    theater location its cookies were set for. Everything else is delegated.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages_loaded = 0
+        self.theater_url = None
+
+    def get(self, url):
+        self.pages_loaded += 1
+        return self.driver.get(url)
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+class DriverPool:
+    """
+    Thread-safe pool of warm headless Chrome drivers. The chromedriver binary is
+    resolved once; drivers are created on demand up to `size`, health-checked on
+    lease, and recycled after `max_pages` page loads or when they stop responding.
+    """
+    def __init__(self, size=DRIVER_POOL_SIZE, max_pages=DRIVER_MAX_PAGES):
+        self.size = size
+        self.max_pages = max_pages
+        self._idle = deque()
+        self._created = 0
+        self._cond = threading.Condition()
+        self._service_path = None
+
+    def start(self):
+        """Resolves the chromedriver binary. Blocking - call it from a scraper thread."""
+        with self._cond:
+            if self._service_path is None:
+                from webdriver_manager.chrome import ChromeDriverManager
+                self._service_path = ChromeDriverManager().install()
+        return self._service_path
+
+    def _create(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless'); options.add_argument('--no-sandbox'); options.add_argument('--disable-dev-shm-usage')
+        with metrics.timer('driver_launch'):
+            return PooledDriver(webdriver.Chrome(service=Service(self.start()), options=options))
+
+    def _is_healthy(self, pooled):
+        from selenium.common.exceptions import WebDriverException
+        try:
+            pooled.driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _discard(self, pooled):
+        try: pooled.driver.quit()
+        except Exception: pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _acquire(self, job=None, timeout=None):
+        waited = 0
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.size:
+                    if job: job.check_cancelled()
+                    if timeout is not None and waited >= timeout:
+                        raise TimeoutError("Timed out waiting for a free browser.")
+                    self._cond.wait(1); waited += 1
+                pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    self._created += 1
+            if pooled is None:
+                try:
+                    return self._create()
+                except Exception:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify()
+                    raise
+            if self._is_healthy(pooled):
+                return pooled
+            print("Discarding unresponsive browser from the pool.")
+            self._discard(pooled)
+
+    def _release(self, pooled, broken=False):
+        if broken or pooled.pages_loaded >= self.max_pages:
+            self._discard(pooled)
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, job=None, timeout=None):
+        """Leases a driver for the duration of the with-block. Blocking - use from scraper threads."""
+        pooled = self._acquire(job, timeout)
+        from selenium.common.exceptions import WebDriverException
+        broken = False
+        try:
+            yield pooled
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self._release(pooled, broken)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+pool = DriverPool()
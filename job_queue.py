@@ -0,0 +1,77 @@
+import asyncio
+import time
+import os
+import database as db
+import metrics
+
+# Workers extend their lease every JOB_HEARTBEAT_SECONDS; a job whose lease runs out is retried elsewhere
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS') or 120)
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 4
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS') or 3)
+# Base delay before a failed attempt is retried; multiplied by the attempt number
+JOB_RETRY_SECONDS = float(os.getenv('JOB_RETRY_SECONDS') or 30)
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL') or 1)
+# Titles per TMDB enrichment job, so a big catalogue spreads over several workers
+ENRICH_CHUNK = 25
+ENRICH_TIMEOUT = float(os.getenv('ENRICH_TIMEOUT') or 600)
+
+LIST_JOB = 'list'
+SHOWTIMES_JOB = 'showtimes'
+ENRICH_JOB = 'enrich'
+
+class JobFailed(Exception):
+    """Raised when a queued job failed on every attempt."""
+
+def run_jobs(kind, payloads, job=None, on_result=None):
+    """
+    Queues one job per payload and waits for all of them. Blocking - call it from the
+    scraper threads. on_result(index, status, result, error) is called as each one
+    finishes; returns [(status, result, error)] in payload order. If the scrape job is
+    cancelled or times out, the unfinished queue jobs are cancelled with it.
+    """
+    conn = db.get_connection()
+    job_ids = []
+    try:
+        job_ids = db.enqueue_jobs(conn, kind, payloads, JOB_MAX_ATTEMPTS)
+        position = {job_id: i for i, job_id in enumerate(job_ids)}
+        outcomes, pending = [None] * len(job_ids), set(job_ids)
+        started = time.monotonic()
+        while True:
+            for job_id, outcome in db.get_finished_jobs(conn, pending).items():
+                pending.discard(job_id)
+                outcomes[position[job_id]] = outcome
+                metrics.observe(f'job_wait:{kind}', time.monotonic() - started)
+                if on_result: on_result(position[job_id], *outcome)
+            if not pending: return outcomes
+            if job: job.sleep(JOB_POLL_INTERVAL)
+            else: time.sleep(JOB_POLL_INTERVAL)
+    finally:
+        # Consumed results are removed; deleting unfinished jobs makes their workers drop them
+        try: db.delete_jobs(conn, job_ids)
+        finally: conn.close()
+
+class QueueEnricher:
+    """Stands in for tmdb.TMDBClient in the bot when the workers do the TMDB lookups."""
+    async def get_details_batch(self, titles, store, verdicts=None):
+        """Same contract as TMDBClient.get_details_batch, answered by 'enrich' jobs (workers classify titles themselves)."""
+        unique = list(dict.fromkeys(titles))
+        if not unique: return {}
+        chunks = [unique[i:i + ENRICH_CHUNK] for i in range(0, len(unique), ENRICH_CHUNK)]
+        job_ids = await store.write(db.enqueue_jobs, ENRICH_JOB, [{'titles': chunk} for chunk in chunks], JOB_MAX_ATTEMPTS)
+        results, pending = {}, set(job_ids)
+        deadline = time.monotonic() + ENRICH_TIMEOUT
+        try:
+            while pending and time.monotonic() < deadline:
+                for job_id, (status, result, error) in (await store.read(db.get_finished_jobs, pending)).items():
+                    pending.discard(job_id)
+                    if status == 'done': results.update({title: tuple(details) for title, details in result.items()})
+                    else: print(f"WARNING: TMDB enrichment job {job_id} failed: {error}")
+                if pending: await asyncio.sleep(JOB_POLL_INTERVAL)
+            if pending: print(f"WARNING: {len(pending)} TMDB enrichment job(s) didn't finish within {ENRICH_TIMEOUT:.0f}s.")
+        finally:
+            await store.write(db.delete_jobs, job_ids)
+        # Missing titles look like a TMDB outage to the check, so they are enriched again next time
+        return {title: results.get(title, (None, False, "API Error", "API Error")) for title in unique}
+
+    async def close(self):
+        pass  # no connection of its own; TMDBClient.close has one to release
@@ -0,0 +1,135 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import os
+import metrics
+
+# Opt-in event loop watchdog: the loop being blocked longer than this (milliseconds) is
+# logged with the stack that blocked it and aggregated per call site. 0 keeps it off.
+WATCHDOG_STALL_MS = float(os.getenv('WATCHDOG_STALL_MS') or 0)
+# Innermost frames shown when a call site's first stall is logged
+STACK_DEPTH = 12
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class CallSite:
+    """Stalls attributed to one line of the bot's own code."""
+    def __init__(self, blocked_in, stack):
+        self.blocked_in = blocked_in
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+def _own_code(frame_summary):
+    return frame_summary.filename.startswith(REPO_DIR) and 'site-packages' not in frame_summary.filename
+
+def _label(frame_summary):
+    path = os.path.relpath(frame_summary.filename, REPO_DIR) if _own_code(frame_summary) else os.path.basename(frame_summary.filename)
+    return f"{path}:{frame_summary.lineno} in {frame_summary.name}"
+
+def _describe(frame):
+    """Returns (call site, innermost frame, formatted stack) for a blocked loop thread's frame."""
+    stack = traceback.extract_stack(frame)
+    # Drop the event loop's own frames above the callback that is blocking it
+    callback = max((i for i, entry in enumerate(stack) if entry.filename.endswith(os.path.join('asyncio', 'events.py'))), default=-1)
+    stack = stack[callback + 1:] or stack
+    # The call site is the innermost frame of the bot's own code; the frame below it is often a library or C call
+    site = next((entry for entry in reversed(stack) if _own_code(entry)), stack[-1])
+    return _label(site), _label(stack[-1]), "".join(traceback.format_list(stack[-STACK_DEPTH:]))
+
+class StallDetector:
+    """
+    A heartbeat task on the event loop notes when it last ran; a monitor thread that
+    finds it overdue grabs the loop thread's stack (sys._current_frames) while it is
+    still blocked. When the heartbeat runs again, its lateness is the stall duration,
+    which is charged to the captured call site.
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.interval = max(threshold / 4, 0.01)
+        self.sites = {}
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._beat = 0.0
+        self._captured = None
+        self._loop_thread = None
+        self._task = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Starts watching the running event loop; call it from the loop."""
+        if self.running: return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        threading.Thread(target=self._monitor, name='watchdog', daemon=True).start()
+        print(f"Loop watchdog reporting stalls over {self.threshold * 1000:.0f}ms.")
+
+    def stop(self):
+        self._stop.set()
+        if self._task: self._task.cancel()
+
+    def reset(self):
+        with self._lock: self.sites = {}
+
+    def report(self, limit=None):
+        """Returns [(site, CallSite)], the most total stall time first."""
+        with self._lock:
+            return sorted(self.sites.items(), key=lambda item: -item[1].total)[:limit]
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                self._beat = now
+                captured, self._captured = self._captured, None
+            lag = now - before - self.interval
+            if lag >= self.threshold: self._record(lag, captured)
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                beat = self._beat
+                stalled = self._captured is None and time.monotonic() - beat > self.interval + self.threshold
+            if not stalled: continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None: continue
+            captured = _describe(frame)
+            with self._lock:
+                # Only if the loop is still in the same stall; otherwise the stack shows later work
+                if self._beat == beat and self._captured is None: self._captured = captured
+            del frame
+
+    def _record(self, lag, captured):
+        site, blocked_in, stack = captured or ("unknown (ended before a stack was taken)", None, None)
+        with self._lock:
+            entry = self.sites.get(site)
+            if entry is None: entry = self.sites[site] = CallSite(blocked_in, stack)
+            entry.count += 1
+            entry.total += lag
+            entry.max = max(entry.max, lag)
+            first = entry.count == 1
+        metrics.incr('loop_stalls')
+        metrics.observe('loop_stall', lag)
+        inner = f" (in {blocked_in})" if blocked_in and blocked_in != site else ""
+        print(f"WARNING: Event loop blocked for {lag * 1000:.0f}ms at {site}{inner}")
+        if first and stack: print(f"    First stall at this site:\n{stack.rstrip()}")
+
+detector = StallDetector(WATCHDOG_STALL_MS / 1000)
+
+def enabled():
+    return WATCHDOG_STALL_MS > 0
+
+def start():
+    """Starts the watchdog when WATCHDOG_STALL_MS is set. Call it from the running loop."""
+    if enabled(): detector.start()
@@ -1,14 +1,26 @@
 import discord
 from discord.ext import commands, tasks
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from datetime import datetime
+import time
 import database as db
+import matcher
+from title_index import index as autocomplete_index
+import backends
+from driver_pool import pool as driver_pool
 import scraper
-import time
+import scrape_jobs
+import notifier
+import job_queue
+import metrics
+import loop_watchdog
+import pipeline
+import scheduler as refresh_scheduler
+import tmdb
+import classifier
+import asyncio
 import re
 import os
+import signal
 
 # --- ⚠️ CONFIGURATION - PASTE YOUR TOKENS HERE ⚠️ ---
 try:
@@ -25,47 +37,91 @@ except (TypeError, ValueError):
     exit()
 # --------------------------------------------------------------------
 
+# Upper bounds for work running on the scraper threads (seconds)
+LIST_SCRAPE_TIMEOUT = float(os.getenv('LIST_SCRAPE_TIMEOUT') or 900)
+SHOWTIME_SCRAPE_TIMEOUT = float(os.getenv('SHOWTIME_SCRAPE_TIMEOUT') or 180)
+# Movie pages a check scrapes at once; each scrape takes a scraper thread (and a pooled browser)
+SHOWTIME_WORKERS = int(os.getenv('SHOWTIME_WORKERS') or driver_pool.size)
+# /showtimes answers from the stored snapshot while it is fresh; stale snapshots are still
+# shown (and refreshed in the background) up to the max age, after which the user waits
+SHOWTIMES_FRESH_MINUTES = float(os.getenv('SHOWTIMES_FRESH_MINUTES') or 60)
+SHOWTIMES_MAX_STALE_HOURS = float(os.getenv('SHOWTIMES_MAX_STALE_HOURS') or 24)
+# A check commits (then notifies) whenever its processing stage has caught up with the
+# movies finished so far; this caps how many movies one commit may hold. 0 means no cap.
+CHECK_COMMIT_CHUNK = int(os.getenv('CHECK_COMMIT_CHUNK') or 0)
+# Concurrent tasks of the check's enrichment stage, and the titles each takes at once
+ENRICH_WORKERS = int(os.getenv('ENRICH_WORKERS') or 2)
+ENRICH_BATCH_SIZE = int(os.getenv('ENRICH_BATCH_SIZE') or 25)
+# Theaters handled by this process, keyed by scraper.theater_id; the first is the default
+THEATERS = {scraper.theater_id(url): url for url in scraper.THEATER_URLS}
+DEFAULT_THEATER = scraper.theater_id(scraper.DEFAULT_THEATER_URL)
+# Most theaters loading their list pages at the same time
+THEATER_CONCURRENCY = int(os.getenv('THEATER_CONCURRENCY') or 2)
+# Seconds a shutdown waits for queued notifications; Docker kills the container after 10
+SHUTDOWN_DRAIN_TIMEOUT = 8
+
 intents = discord.Intents.default()
 bot = discord.Bot(intents=intents)
 watchlist_commands = bot.create_group("watchlist", "Manage your movie watchlist")
 ignore_commands = bot.create_group("ignore", "Manage your personal ignore list")
 
+store = db.AsyncDatabase()
+scrape_backend = backends.create_backend(backends.SCRAPER_BACKEND, driver_pool, SHOWTIME_WORKERS)
+# With the queue backend the workers (worker.py) do the TMDB lookups as well
+tmdb_client = job_queue.QueueEnricher() if scrape_backend.name == 'queue' else tmdb.TMDBClient(TMDB_API_KEY)
+notifications = notifier.Notifier(bot)
+scheduler = refresh_scheduler.RefreshScheduler()
+
 # Global flag to prevent multiple checks from running simultaneously
 check_in_progress = False
+started = False
+stopping = False
+# In-flight showtime scrapes by (theater, title), so concurrent requests share one scrape
+showtime_refreshes = {}
+theater_slots = asyncio.Semaphore(THEATER_CONCURRENCY)
 
-# --- NEW HELPER FUNCTION FOR SMARTER UPDATES ---
-def have_new_dates_been_added(old_showtimes_str: str, new_showtimes_list: list) -> bool:
-    """
-    Compares old and new showtimes to see if new dates have been added.
-    Returns True only if the new list is a proper superset of the old list.
-    """
-    # If there were no dates before, any new date is an update.
-    if not old_showtimes_str or "not listed" in old_showtimes_str:
-        return bool(new_showtimes_list) # True only if the new list is not empty
-    
-    # Convert strings/lists to sets for easy comparison
-    old_dates = {date.strip() for date in old_showtimes_str.split(',') if date.strip()}
-    new_dates = set(new_showtimes_list)
-    
-    # An update has occurred if all old dates are still present AND there are more new dates.
-    return old_dates.issubset(new_dates) and len(new_dates) > len(old_dates)
-
-def setup_driver():
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless'); options.add_argument('--no-sandbox'); options.add_argument('--disable-dev-shm-usage')
-    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-
-async def send_notification(channel_id, embed, content=None):
-    if not channel_id: return
+async def _refresh_showtimes(theater, title, movie_url):
     try:
-        channel = await bot.fetch_channel(channel_id)
-        await channel.send(content=content, embed=embed)
-        print(f"    -> Notification sent to channel #{channel.name}.")
+        showtimes = await scrape_jobs.start_job(scrape_backend.get_specific_showtimes, movie_url, timeout=SHOWTIME_SCRAPE_TIMEOUT, theater_url=THEATERS[theater]).result()
+    except asyncio.TimeoutError:
+        return {"Error": "Timed out fetching showtimes. Please try again later."}
     except Exception as e:
-        print(f"    -> ERROR sending notification: {e}")
+        print(f"ERROR refreshing showtimes for '{title}' at {theater}: {e}")
+        return {"Error": "Could not fetch showtimes. Please try again later."}
+    if "Error" not in showtimes:
+        await store.write(db.save_showtime_snapshot, theater, title, showtimes)
+    return showtimes
 
-async def perform_movie_check():
-    """Extracted check logic that can be called from both scheduled task and manual command"""
+def refresh_showtimes(theater, title, movie_url):
+    """Returns the in-flight scrape task for a movie at a theater, starting one if none is running."""
+    key = (theater, title)
+    task = showtime_refreshes.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_refresh_showtimes(theater, title, movie_url))
+        showtime_refreshes[key] = task
+        task.add_done_callback(lambda _: showtime_refreshes.pop(key, None))
+    return task
+
+def _theater_label(theater):
+    return f" at {theater}" if len(THEATERS) > 1 else ""
+
+async def perform_movie_check(progress=None, full=False, due=None):
+    """
+    Extracted check logic that can be called from both scheduled task and manual command.
+    All Selenium work runs on the scraper threads; `progress` is an optional coroutine
+    function that receives the list-scrape progress messages as they stream in.
+    Movies whose listing is unchanged reuse their stored details unless `full` is set.
+    
+    Without `due`, this polls every theater's list pages and visits the movie pages the
+    scheduler says are due. With `due` ((theater, title) keys the scheduler already
+    took), only those movie pages are refreshed. TMDB enrichment and the movie catalogue
+    are shared by all theaters; showtimes are tracked per theater.
+
+    The check is a pipeline: movies stream from each parsed list page through enrichment,
+    scheduling, showtime scrapes and processing, connected by bounded queues. A movie is
+    processed (committed, then announced) once every theater that could list it is done
+    with it, so with a single theater notifications go out while later pages still load.
+    """
     global check_in_progress
     
     if check_in_progress:
@@ -74,116 +130,400 @@ async def perform_movie_check():
         
     check_in_progress = True
     print(f"[{datetime.now()}] --- Running Movie Check ---")
+    run = metrics.start_run('full' if full else 'list' if due is None else 'due')
+    succeeded, catalogue, visit, notified = False, {}, set(), 0
+    # Writes are staged and committed in small batches as movies finish; notifications
+    # only go out once the data they announce is committed, so a crash just repeats them
+    batch = db.CheckBatch()
+    staged_notifications, new_titles, staged = [], [], 0
+    async def flush():
+        nonlocal batch, staged_notifications, new_titles, notified, staged
+        # Swapped out before the commit is awaited: anything staged meanwhile goes into the next one
+        committing, sending, added = batch, staged_notifications, new_titles
+        batch, staged_notifications, new_titles, staged = db.CheckBatch(), [], [], 0
+        if len(committing):
+            with metrics.timer('check.commit'): await store.write(db.apply_check_batch, committing)
+        for title in added: autocomplete_index.titles.add(title)
+        # Sent in the background, packed per channel, so the check doesn't wait on Discord
+        for channel_id, embed, mentions in sending:
+            notifications.notify(channel_id, embed, mentions)
+        notified += len(sending)
     
-    driver = setup_driver()
-    conn = db.get_connection()
     try:
-        scraped_movies = scraper.scrape_all_movies(driver)
-                
-        print(f"Found {len(scraped_movies)} unique movies. Processing...")
-        for movie in scraped_movies:
-            if db.is_movie_ignored_by_any_user(conn, movie['title']):
-                print(f"\nSkipping '{movie['title']}' as it is on a user's ignore list.")
-                continue
-            
-            details, is_anime, genres_str, overview = scraper.get_tmdb_details(movie['title'], TMDB_API_KEY)
-            db_movie = db.get_movie(conn, movie['title'])
-            watchers = db.get_watchers_for_movie(conn, movie['title'])
+        if due is None and not THEATERS:
+            raise RuntimeError("No theater configured; set THEATER_URL or THEATER_URLS.")
+        index = await store.read(matcher.get_index)
+        # Per title: the theaters listing it, their showtime results (None when the page wasn't visited) and progress flags
+        movies = {}
+        listed = {}
+        watchers_at = {theater: {} for theater in THEATERS}
+        theater_rows = {theater: {} for theater in THEATERS}
+        db_movies, fingerprints, verdicts, tmdb_results = {}, {}, {}, {}
+        tracked, unchanged = set(), set()
+        # Theaters still loading their list pages may list any unfinished movie too
+        polling, failed = set(THEATERS) if due is None else set(), {}
+        due_keys = set(due or ())
+        def refresh_interval(key):
+            theater, title = key
+            return refresh_scheduler.refresh_interval(catalogue[title]['release_date'], len(watchers_at[theater].get(title, [])), tmdb_results[title][1])
+
+        # --- Stage: list pages ---
+        async def add_listings(theater, page):
+            """Feeds the movies of one list page into the pipeline."""
+            fresh = {}
+            for movie in page:
+                if movie['title'] not in listed.setdefault(theater, set()): fresh.setdefault(movie['title'], movie)
+            if not fresh: return
+            listed[theater].update(fresh)
+            with metrics.timer('check.matching'):
+                ignored = index.ignored_titles(fresh)
+                watchers_at[theater].update(index.watchers_for_titles(fresh, theater))
+            for title, movie in fresh.items():
+                state = movies.get(title)
+                if state is None:
+                    # The catalogue is shared by all theaters; the first listing wins
+                    catalogue[title] = movie
+                    state = movies[title] = {'theaters': [], 'showtimes': {}, 'enriched': False, 'done': title in ignored}
+                    if title in ignored: print(f"\nSkipping '{title}' as it is on a user's ignore list.")
+                    else: await enrich.put(title)
+                state['theaters'].append(theater)
+                if state['enriched'] and not state['done']: await schedule.put((theater, title))
+
+        async def poll(theater):
+            try:
+                async with theater_slots:
+                    job = scrape_jobs.start_job(scrape_backend.scrape_all_movies, timeout=LIST_SCRAPE_TIMEOUT, theater_url=THEATERS[theater])
+                    async for kind, payload in job.events():
+                        if kind == 'progress' and progress:
+                            await progress(f"[{theater}] {payload}" if len(THEATERS) > 1 else payload)
+                        elif kind == 'item':
+                            await add_listings(theater, payload)
+                    # Backends that don't stream their pages (the queue) hand everything over here
+                    await add_listings(theater, await job.result())
+            except Exception as e:
+                print(f"ERROR scraping the list pages for {theater}: {e!r}")
+                failed[theater] = e
+            polling.discard(theater)
+            await process.put(('polled', theater))
+
+        # --- Stage: enrichment ---
+        async def enrich_titles(titles):
+            db_movies.update(await store.read(db.get_movies, titles))
+            lookups = []
+            if due is not None:
+                # Refreshes work from the stored rows, which say nothing new about the listing;
+                # only list polls classify, enrich and fingerprint
+                unchanged.update(titles)
+                for title in titles:
+                    row = db_movies[title]
+                    tmdb_results[title] = (None, bool(row['is_anime']), None, row['overview'])
+            else:
+                with metrics.timer('check.classify'):
+                    found, reclassified = await store.write(classifier.classify_titles, titles)
+                verdicts.update(found)
+                for title in titles:
+                    fingerprints[title] = db.list_fingerprint(catalogue[title])
+                    row = db_movies.get(title)
+                    # Titles classified under older rules go through TMDB again (mostly from its cache);
+                    # their row is rewritten with the new verdict when they are processed
+                    if not full and row is not None and row['list_fingerprint'] == fingerprints[title] and title not in reclassified:
+                        unchanged.add(title)
+                        tmdb_results[title] = (None, bool(row['is_anime']), None, row['overview'])
+                    else:
+                        lookups.append(title)
+            if lookups:
+                with metrics.timer('check.tmdb'): tmdb_results.update(await tmdb_client.get_details_batch(lookups, store, verdicts))
+            for title in titles:
+                state = movies[title]
+                state['enriched'] = True
+                for theater in list(state['theaters']): await schedule.put((theater, title))
+
+        # --- Stage: scheduling ---
+        async def schedule_visits(keys):
+            """Only anime and watched titles need their movie pages visited, per theater and only when due."""
+            for theater in {theater for theater, _ in keys}:
+                theater_rows[theater].update(await store.read(db.get_theater_movies, theater, [title for key_theater, title in keys if key_theater == theater]))
+            for key in keys:
+                theater, title = key
+                if not (tmdb_results[title][1] or title in watchers_at[theater]):
+                    await process.put((key, None))
+                    continue
+                tracked.add(key)
+                if due is not None:
+                    taken = key in due_keys
+                else:
+                    state = theater_rows[theater].get(title)
+                    if title not in unchanged or state is None:
+                        taken = scheduler.offer(key, 0)
+                    elif key not in scheduler:
+                        taken = scheduler.offer(key, (state['showtimes_checked_at'] or 0) + refresh_interval(key))
+                    else:
+                        taken = scheduler.offer(key)
+                if taken:
+                    visit.add(key)
+                    await showtimes.put(key)
+                else:
+                    await process.put((key, None))
+
+        # --- Stage: showtime scrapes ---
+        async def scrape_showtimes(keys):
+            for key in keys:
+                theater, title = key
+                try:
+                    showtimes_dict = await scrape_jobs.start_job(scrape_backend.get_specific_showtimes, catalogue[title]['cinemark_url'], timeout=SHOWTIME_SCRAPE_TIMEOUT, theater_url=THEATERS[theater]).result()
+                except asyncio.TimeoutError:
+                    showtimes_dict = {"Error": "Timed out scraping showtimes."}
+                except Exception as e:
+                    print(f"ERROR scraping showtimes for '{title}'{_theater_label(theater)}: {e!r}")
+                    showtimes_dict = {"Error": "Could not scrape showtimes."}
+                await process.put((key, showtimes_dict))
+
+        # --- Stage: processing and notifications ---
+        async def process_results(items):
+            nonlocal staged
+            for item in items:
+                if item[0] == 'polled':
+                    ready = [title for title, state in movies.items() if not state['done']]
+                else:
+                    (theater, title), showtimes_dict = item
+                    movies[title]['showtimes'][theater] = showtimes_dict
+                    ready = [title]
+                for title in ready:
+                    state = movies[title]
+                    if state['done'] or len(state['showtimes']) < len(state['theaters']): continue
+                    if any(theater in polling and theater not in state['theaters'] for theater in THEATERS): continue
+                    state['done'] = True
+                    await process_movie(title, state)
+                    staged += 1
+                    if CHECK_COMMIT_CHUNK and staged >= CHECK_COMMIT_CHUNK: await flush()
+            await flush()
+
+        async def process_movie(title, state):
+            movie = catalogue[title]
+            details, is_anime, genres_str, overview = tmdb_results[title]
+            db_movie = db_movies.get(title)
+            theaters = [theater for theater in THEATERS if theater in state['theaters']]
+            watchers = sorted({user_id for theater in theaters for user_id in watchers_at[theater].get(title, [])})
             is_watched = bool(watchers)
             
-            print(f"\nProcessing: '{movie['title']}' (Anime: {is_anime}, Watched: {is_watched})")
+            print(f"\nProcessing: '{title}' (Anime: {is_anime}{f' by {verdicts[title].rule}' if title in verdicts and verdicts[title].rule else ''}, Watched: {is_watched}, Theaters: {', '.join(theaters)})")
+            
+            available, updates = {}, []
+            for theater in theaters:
+                key = (theater, title)
+                if key not in tracked: continue
+                row = theater_rows[theater].get(title)
+                old_showtimes_str = row['showtimes'] if row else None
+                showtimes_str = old_showtimes_str or ""
+                new_dates = []
+                if key not in visit:
+                    print(f"    -> Showtimes{_theater_label(theater)} not due for a refresh, skipping movie page.")
+                else:
+                    showtimes_dict = state['showtimes'][theater]
+                    if "Error" in showtimes_dict:
+                        scheduler.schedule(key, time.time() + refresh_scheduler.RETRY_SECONDS)
+                    else:
+                        digest = db.showtimes_digest(showtimes_dict)
+                        batch.set_showtimes_digest(theater, title, digest)
+                        batch.save_showtime_snapshot(theater, title, showtimes_dict)
+                        scheduler.schedule(key, time.time() + refresh_interval(key))
+                        if "Notice" not in showtimes_dict:
+                            showtimes_str = ", ".join(showtimes_dict.keys())
+                            # Diffed against every date ever recorded here, unless the page is identical to last time
+                            if row is None or digest != row['showtimes_digest']:
+                                new_dates, new_times = await store.read(db.diff_showtimes, theater, title, showtimes_dict)
+                                if new_times: print(f"    -> {len(new_times)} new showtime(s) across {len(new_dates)} new date(s){_theater_label(theater)}.")
+                            batch.record_showtimes(theater, title, showtimes_dict)
+                if showtimes_str != old_showtimes_str:
+                    batch.update_showtimes(theater, title, showtimes_str)
+                available[theater] = showtimes_str
+                if new_dates: updates.append((theater, old_showtimes_str, showtimes_str, new_dates))
+            # Re-enriched movies get their row rewritten (listing, verdict, overview) in the same commit
+            # as the fingerprint describing it. A failed TMDB lookup clears the fingerprint instead, so
+            # the next run enriches the movie again.
+            if title not in unchanged:
+                if genres_str == "API Error":
+                    if db_movie is not None: batch.set_list_fingerprint(title, None)
+                else:
+                    if db_movie is not None: batch.add_or_update_movie(movie, 1 if is_anime else 0, overview)
+                    batch.set_list_fingerprint(title, fingerprints[title])
             
-            showtimes_list = [] # Use a list to pass to our new check function
-            showtimes_str = db_movie['showtimes'] if db_movie else ""
-            if is_anime or is_watched:
-                showtimes_dict = scraper.get_specific_showtimes(driver, movie['cinemark_url'])
-                if "Error" not in showtimes_dict and "Notice" not in showtimes_dict:
-                    showtimes_list = list(showtimes_dict.keys())
-                    showtimes_str = ", ".join(showtimes_list)
+            def add_available_dates(embed):
+                if len(THEATERS) <= 1:
+                    embed.add_field(name="Available Dates", value=next(iter(available.values()), "") or "Not yet listed")
+                else:
+                    for theater, showtimes_str in available.items():
+                        embed.add_field(name=f"Available Dates ({theater})", value=showtimes_str or "Not yet listed", inline=False)
             
             if db_movie is None:
                 print("    -> NEW MOVIE!")
-                db.add_or_update_movie(conn, movie, showtimes_str, 1 if is_anime else 0, overview)
+                batch.add_or_update_movie(movie, 1 if is_anime else 0, overview)
+                new_titles.append(title)
                 desc_field = f"**Release Date:** {movie['release_date']}\n**Genres:** {genres_str}\n\n**Description:**\n{overview}\n"
                                 
-                all_movies_embed = discord.Embed(title=f"🎬 New Movie Added: {movie['title']}", description=desc_field, url=movie['cinemark_url'], color=discord.Color.dark_grey() if not is_anime else discord.Color.green())
+                all_movies_embed = discord.Embed(title=f"🎬 New Movie Added: {title}", description=desc_field, url=movie['cinemark_url'], color=discord.Color.dark_grey() if not is_anime else discord.Color.green())
                 all_movies_embed.set_image(url=movie['poster_url'])
-                await send_notification(DISCORD_CHANNEL_ALL_MOVIES_ID, all_movies_embed)
+                staged_notifications.append((DISCORD_CHANNEL_ALL_MOVIES_ID, all_movies_embed, ()))
                 
                 if is_anime:
-                    anime_embed = discord.Embed(title=f"✨ New Anime Movie: {movie['title']}", description=desc_field, url=movie['cinemark_url'], color=discord.Color.green())
+                    anime_embed = discord.Embed(title=f"✨ New Anime Movie: {title}", description=desc_field, url=movie['cinemark_url'], color=discord.Color.green())
                     anime_embed.set_image(url=movie['poster_url'])
-                    anime_embed.add_field(name="Available Dates", value=showtimes_str or "Not yet listed")
-                    await send_notification(DISCORD_CHANNEL_ANIME_ID, anime_embed)
+                    add_available_dates(anime_embed)
+                    staged_notifications.append((DISCORD_CHANNEL_ANIME_ID, anime_embed, ()))
                 
                 if is_watched:
-                    ping_message = " ".join([f"<@{user_id}>" for user_id in watchers]) if watchers else None
-                    watchlist_embed = discord.Embed(title=f"🔔 New Watchlist Movie: {movie['title']}", description=desc_field, url=movie['cinemark_url'], color=discord.Color.gold())
+                    watchlist_embed = discord.Embed(title=f"🔔 New Watchlist Movie: {title}", description=desc_field, url=movie['cinemark_url'], color=discord.Color.gold())
                     watchlist_embed.set_image(url=movie['poster_url'])
-                    watchlist_embed.add_field(name="Available Dates", value=showtimes_str or "Not yet listed")
-                    await send_notification(DISCORD_CHANNEL_WATCHLIST_ID, watchlist_embed, content=ping_message)
+                    add_available_dates(watchlist_embed)
+                    staged_notifications.append((DISCORD_CHANNEL_WATCHLIST_ID, watchlist_embed, watchers))
             
-            elif (is_anime or is_watched) and have_new_dates_been_added(db_movie['showtimes'], showtimes_list):
+            elif updates:
                 print("    -> NEW SHOWTIMES ADDED!")
-                db.update_showtimes(conn, movie['title'], showtimes_str)
-                update_embed = discord.Embed(title=f"🔄 Showtimes Updated for: {movie['title']}", url=movie['cinemark_url'], color=discord.Color.blue())
-                update_embed.set_image(url=movie['poster_url'])
-                update_embed.add_field(name="Old Dates", value=db_movie['showtimes'] or "None", inline=False)
-                update_embed.add_field(name="New Dates", value=showtimes_str or "None", inline=False)
-                                
-                if is_watched:
-                    ping_message = " ".join([f"<@{user_id}>" for user_id in watchers]) if watchers else None
-                    await send_notification(DISCORD_CHANNEL_WATCHLIST_ID, update_embed, content=ping_message)
+                for theater, old_showtimes_str, showtimes_str, new_dates in updates:
+                    update_embed = discord.Embed(title=f"🔄 Showtimes Updated for: {title}{_theater_label(theater)}", url=movie['cinemark_url'], color=discord.Color.blue())
+                    update_embed.set_image(url=movie['poster_url'])
+                    update_embed.add_field(name="Old Dates", value=old_showtimes_str or "None", inline=False)
+                    update_embed.add_field(name="New Dates", value=showtimes_str or "None", inline=False)
+                    update_embed.add_field(name="Just Added", value=", ".join(new_dates), inline=False)
+                    
+                    theater_watchers = watchers_at[theater].get(title, [])
+                    if theater_watchers:
+                        staged_notifications.append((DISCORD_CHANNEL_WATCHLIST_ID, update_embed, theater_watchers))
                                 
-                if is_anime:
-                    await send_notification(DISCORD_CHANNEL_ANIME_ID, update_embed)
+                    if is_anime:
+                        staged_notifications.append((DISCORD_CHANNEL_ANIME_ID, update_embed, ()))
             else:
                 print("    -> No changes detected.")
-            time.sleep(1)
+
+        flow = pipeline.Pipeline()
+        enrich = flow.stage('enrich', enrich_titles, ENRICH_WORKERS, ENRICH_BATCH_SIZE)
+        schedule = flow.stage('schedule', schedule_visits, batch_size=pipeline.PIPELINE_QUEUE_SIZE)
+        showtimes = flow.stage('showtimes', scrape_showtimes, SHOWTIME_WORKERS)
+        process = flow.stage('process', process_results, batch_size=pipeline.PIPELINE_QUEUE_SIZE)
+        async def feed():
+            if due is None:
+                with metrics.timer('check.list_poll'):
+                    await asyncio.gather(*(poll(theater) for theater in THEATERS))
+                if len(failed) == len(THEATERS): raise next(iter(failed.values()))
+                scheduler.list_polled()
+            else:
+                rows = await store.read(db.get_movies, {title for _, title in due})
+                for theater, title in due:
+                    if title in rows and theater in THEATERS: await add_listings(theater, [dict(rows[title])])
+            # Upstream first, so each stage has everything it will ever get before it is closed
+            for stage in (enrich, schedule, showtimes, process): await stage.close()
+        await flow.run(feed())
+
+        print(f"\nChecked {len(catalogue)} unique movies across {len(listed)} theater(s).")
+        if unchanged: print(f"{len(unchanged)} unchanged movie(s) reused stored details.")
+        if due is None:
+            # Theaters whose poll failed keep their schedule
+            scheduler.retain(tracked | {key for key in scheduler if key[0] in failed})
+            waiting = scheduler.due_count()
+            if waiting: print(f"Scrape budget used up; {waiting} due movie page(s) wait for the next scheduler ticks.")
+        succeeded = True
         return True
     except Exception as e:
         print(f"An unexpected error occurred during the main process: {e}")
         return False
     finally:
-        driver.quit()
-        conn.close()
         check_in_progress = False
+        for step, stats in scraper.get_wait_stats().items():
+            print(f"Wait '{step}': {stats['count']} samples, avg {stats['avg']:.2f}s, max {stats['max']:.2f}s, {stats['timeouts']} timeouts")
+        metrics.incr('checks' if succeeded else 'check_failures')
+        finished = run.finish(succeeded, movies=len(catalogue), pages=len(visit), notifications=notified)
+        slowest = sorted(finished['stages'].items(), key=lambda item: -item[1][1])[:6]
+        print("Stage times: " + ", ".join(f"{stage} {count}x {seconds:.1f}s" for stage, (count, seconds) in slowest))
+        try: await store.write(db.record_run, finished)
+        except Exception as e: print(f"WARNING: Could not record the check run: {e}")
         print(f"--- Movie Check Finished [{datetime.now()}] ---")
 
+async def restore_schedule():
+    """
+    Rebuilds the scheduler from the database after a restart: the list pages are due one
+    poll interval after the last successful poll, and movie pages visited before get their
+    refresh deadlines back, so a redeploy doesn't start with a full scrape.
+    """
+    last_poll = await store.read(db.get_last_list_poll)
+    if last_poll: scheduler.list_polled(now=last_poll)
+    index = await store.read(matcher.get_index)
+    for row in await store.read(db.get_refresh_states):
+        theater, title = row['theater'], row['title']
+        if theater not in THEATERS or index.is_ignored(title): continue
+        watchers = index.watchers(title, theater)
+        if not (row['is_anime'] or watchers): continue
+        interval = refresh_scheduler.refresh_interval(row['release_date'], len(watchers), bool(row['is_anime']))
+        scheduler.schedule((theater, title), row['showtimes_checked_at'] + interval)
+    if last_poll:
+        print(f"Last list poll finished {datetime.fromtimestamp(last_poll):%Y-%m-%d %H:%M}; next one due {datetime.fromtimestamp(scheduler.next_list_poll):%Y-%m-%d %H:%M}, {len(scheduler)} movie page(s) scheduled.")
+    else:
+        print("No successful list poll recorded yet; checking right away.")
+
 @bot.event
 async def on_ready():
-    db.init_db()
     print(f"Logged in as {bot.user}")
-    if not check_for_updates.is_running():
-        check_for_updates.start()
+    # on_ready fires again after every reconnect; startup work only runs once. Commands are
+    # answered from the database meanwhile, and browsers start when a scrape first needs one.
+    global started
+    if started: return
+    started = True
+    loop_watchdog.start()
+    # py-cord's own handlers stop the loop and cancel every task, queued notifications included
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try: loop.add_signal_handler(sig, lambda: asyncio.ensure_future(shutdown()))
+        except (NotImplementedError, RuntimeError): pass
+    await store.read(autocomplete_index.load)
+    await restore_schedule()
+    check_for_updates.start()
 
-@tasks.loop(hours=24)
+async def shutdown():
+    """Sends what is still queued for Discord, then closes the TMDB client and the bot. A second signal stops right away."""
+    global stopping
+    if stopping:
+        asyncio.get_running_loop().stop()
+        return
+    stopping = True
+    print("Shutting down...")
+    check_for_updates.cancel()
+    try: await notifications.drain(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+    finally:
+        # aiohttp warns about a session that is never closed
+        await tmdb_client.close()
+        await bot.close()
+
+@tasks.loop(minutes=refresh_scheduler.SCHEDULER_TICK_MINUTES)
 async def check_for_updates():
-    await perform_movie_check()
+    """Scheduler tick: polls the list pages on their cadence, otherwise refreshes a small batch of due movies."""
+    if check_in_progress: return
+    if scheduler.list_due():
+        await perform_movie_check()
+        return
+    due = scheduler.take_due(refresh_scheduler.SCHEDULER_BATCH_SIZE)
+    if due:
+        await perform_movie_check(due=due)
 
 # --- Autocomplete Functions ---
+# Served from the resident title_index; no database access on the hot path
 async def movie_autocomplete(ctx: discord.AutocompleteContext):
-    conn = db.get_connection()
-    titles = db.get_all_movie_titles(conn)
-    conn.close()
-    return [title for title in titles if ctx.value.lower() in title.lower()][:25]
+    return autocomplete_index.titles.search(ctx.value)
 
 async def watchlist_autocomplete(ctx: discord.AutocompleteContext):
-    conn = db.get_connection()
-    items = db.get_user_watchlist(conn, ctx.interaction.user.id)
-    conn.close()
-    return [item['pattern'] for item in items if ctx.value.lower() in item['pattern'].lower()][:25]
+    return autocomplete_index.search_watchlist(ctx.interaction.user.id, ctx.value)
 
 async def ignore_autocomplete(ctx: discord.AutocompleteContext):
-    conn = db.get_connection()
-    items = db.get_user_ignore_list(conn, ctx.interaction.user.id)
-    conn.close()
-    return [item['pattern'] for item in items if ctx.value.lower() in item['pattern'].lower()][:25]
+    return autocomplete_index.search_ignore_list(ctx.interaction.user.id, ctx.value)
+
+async def theater_autocomplete(ctx: discord.AutocompleteContext):
+    return [theater for theater in THEATERS if ctx.value.lower() in theater.lower()][:25]
+
+def _unknown_theater(theater):
+    return theater is not None and theater not in THEATERS
     
 # --- Bot Commands ---
 @bot.slash_command(name="check", description="Manually trigger a check for movie updates.")
 @commands.is_owner()
-async def force_check(ctx: discord.ApplicationContext):
+async def force_check(ctx: discord.ApplicationContext, full: discord.Option(bool, "Re-check every movie, even ones whose listing hasn't changed", default=False)):
     global check_in_progress
     
     if check_in_progress:
@@ -191,23 +531,90 @@ async def force_check(ctx: discord.ApplicationContext):
         return
         
     await ctx.respond("✅ Manual check initiated...", ephemeral=True)
-    success = await perform_movie_check()
+
+    async def report_progress(message):
+        try: await ctx.interaction.edit_original_response(content=f"⏳ {message}")
+        except discord.HTTPException: pass
+
+    # Everything becomes due now; whatever exceeds the scrape budget is picked up by the next ticks
+    scheduler.enqueue_all()
+    success = await perform_movie_check(progress=report_progress, full=full)
     
     if success:
-        await ctx.followup.send("✅ Manual check completed successfully!", ephemeral=True)
+        waiting = scheduler.due_count()
+        await ctx.followup.send("✅ Manual check completed successfully!" + (f" {waiting} movie page(s) are queued within the scrape budget." if waiting else ""), ephemeral=True)
     else:
         await ctx.followup.send("❌ Manual check encountered an error. Check the logs for details.", ephemeral=True)
 
+@bot.slash_command(name="stats", description="Summarize where the time went in recent checks.")
+@commands.is_owner()
+async def stats_cmd(ctx: discord.ApplicationContext, runs: discord.Option(int, "How many recent checks to summarize", min_value=1, max_value=100, default=10)):
+    recent = await store.read(db.get_recent_runs, runs)
+    if not recent: await ctx.respond("ℹ️ No checks have been recorded yet.", ephemeral=True); return
+    durations = [run['duration'] for run in recent]
+    succeeded = sum(run['success'] for run in recent)
+    description = (f"**{succeeded}/{len(recent)}** succeeded · avg {sum(durations) / len(durations):.1f}s · max {max(durations):.1f}s\n"
+                   f"{sum(run['pages'] for run in recent)} movie page(s) refreshed · {sum(run['notifications'] for run in recent)} notification(s)")
+    embed = discord.Embed(title=f"📊 Last {len(recent)} check(s)", description=description, color=discord.Color.teal())
+    stage_totals, counter_totals = {}, {}
+    for run in recent:
+        for stage, (count, seconds) in run['stages'].items():
+            totals = stage_totals.setdefault(stage, [0, 0.0])
+            totals[0] += count; totals[1] += seconds
+        for name, value in run['counters'].items(): counter_totals[name] = counter_totals.get(name, 0) + value
+    # check.* stages are wall-clock phases of a check; the rest are single calls that may overlap in parallel
+    lines = [
+        f"`{stage}` {seconds / len(recent):.1f}s/check · {count} call(s), avg {seconds / count * 1000:.0f}ms"
+        for stage, (count, seconds) in sorted(stage_totals.items(), key=lambda item: -item[1][1])[:12]
+    ]
+    embed.add_field(name="Time per stage", value="\n".join(lines) or "Nothing timed.", inline=False)
+    if counter_totals:
+        embed.add_field(name="Counters", value=", ".join(f"{name}: {value}" for name, value in sorted(counter_totals.items()))[:1024], inline=False)
+    if scrape_backend.name == 'queue':
+        queue = await store.read(db.get_job_counts)
+        embed.add_field(name="Job queue", value=", ".join(f"{status}: {count}" for status, count in sorted(queue.items())) or "Empty", inline=False)
+    latest = recent[0]
+    embed.add_field(name="Latest check", value=f"<t:{int(latest['started_at'])}:R> · {latest['kind']} · {latest['duration']:.1f}s · {'✅' if latest['success'] else '❌'}", inline=False)
+    await ctx.respond(embed=embed, ephemeral=True)
+
+@bot.slash_command(name="stalls", description="Show where the event loop was blocked the longest.")
+@commands.is_owner()
+async def stalls_cmd(ctx: discord.ApplicationContext, reset: discord.Option(bool, "Clear the collected stalls afterwards", default=False)):
+    if not loop_watchdog.enabled():
+        await ctx.respond("ℹ️ The loop watchdog is off. Set `WATCHDOG_STALL_MS` (e.g. `250`) and restart to enable it.", ephemeral=True); return
+    detector = loop_watchdog.detector
+    sites = detector.report()
+    since = f"<t:{int(detector.started_at)}:R>" if detector.started_at else "startup"
+    if not sites:
+        await ctx.respond(f"✅ No stalls over {loop_watchdog.WATCHDOG_STALL_MS:.0f}ms since {since}.", ephemeral=True); return
+    total = sum(site.total for _, site in sites)
+    embed = discord.Embed(title="🐢 Event loop stalls", description=f"**{sum(site.count for _, site in sites)}** stall(s) over {loop_watchdog.WATCHDOG_STALL_MS:.0f}ms since {since}, {total:.1f}s blocked in total", color=discord.Color.orange())
+    for name, site in sites[:10]:
+        inner = f"\nin `{site.blocked_in}`" if site.blocked_in and site.blocked_in != name else ""
+        embed.add_field(name=name[:256], value=f"{site.count}x · total {site.total:.2f}s · max {site.max * 1000:.0f}ms{inner}"[:1024], inline=False)
+    if reset: detector.reset()
+    await ctx.respond(embed=embed, ephemeral=True)
+
 @bot.slash_command(name="showtimes", description="Get the full list of showtimes for a specific movie.")
-async def get_showtimes_cmd(ctx, movie: discord.Option(str, autocomplete=movie_autocomplete)):
+async def get_showtimes_cmd(ctx, movie: discord.Option(str, autocomplete=movie_autocomplete), theater: discord.Option(str, "Theater (defaults to the first configured one)", autocomplete=theater_autocomplete, required=False, default=None)):
+    if _unknown_theater(theater):
+        await ctx.respond(f"❌ Unknown theater '{theater}'.", ephemeral=True); return
+    theater = theater or DEFAULT_THEATER
     await ctx.defer()
-    conn = db.get_connection(); movie_data = db.get_movie(conn, movie); conn.close()
+    movie_data = await store.read(db.get_movie, movie)
     if not movie_data:
         await ctx.followup.send(f"❌ Movie '{movie}' not found."); return
-    driver = setup_driver()
-    try: showtimes = scraper.get_specific_showtimes(driver, movie_data['cinemark_url'])
-    finally: driver.quit()
-    embed = discord.Embed(title=f"Showtimes for {movie}", url=movie_data['cinemark_url'], color=discord.Color.gold(), description=movie_data['overview'])
+    snapshot = await store.read(db.get_showtime_snapshot, theater, movie)
+    age = time.time() - snapshot[1] if snapshot else None
+    if snapshot and age < SHOWTIMES_MAX_STALE_HOURS * 3600:
+        showtimes, fetched_at = snapshot
+        if age >= SHOWTIMES_FRESH_MINUTES * 60:
+            refresh_showtimes(theater, movie, movie_data['cinemark_url'])  # stale-while-revalidate
+    else:
+        showtimes, fetched_at = await asyncio.shield(refresh_showtimes(theater, movie, movie_data['cinemark_url'])), time.time()
+    embed = discord.Embed(title=f"Showtimes for {movie}{_theater_label(theater)}", url=movie_data['cinemark_url'], color=discord.Color.gold(), description=movie_data['overview'])
+    embed.set_footer(text="Showtimes as of")
+    embed.timestamp = datetime.fromtimestamp(fetched_at).astimezone()
     if movie_data['poster_url']: embed.set_image(url=movie_data['poster_url'])
     if "Error" in showtimes or "Notice" in showtimes:
         embed.add_field(name="Status", value=list(showtimes.values())[0])
@@ -217,36 +624,44 @@ async def get_showtimes_cmd(ctx, movie: discord.Option(str, autocomplete=movie_a
     await ctx.followup.send(embed=embed)
 
 @watchlist_commands.command(name="add", description="Add a movie to your personal watchlist by its exact title.")
-async def watchlist_add(ctx, movie: discord.Option(str, autocomplete=movie_autocomplete)):
-    conn = db.get_connection(); success = db.add_to_watchlist(conn, ctx.author.id, movie, is_regex=False); conn.close()
+async def watchlist_add(ctx, movie: discord.Option(str, autocomplete=movie_autocomplete), theater: discord.Option(str, "Only notify for this theater", autocomplete=theater_autocomplete, required=False, default=None)):
+    if _unknown_theater(theater):
+        await ctx.respond(f"❌ Unknown theater '{theater}'.", ephemeral=True); return
+    success = await store.write(db.add_to_watchlist, ctx.author.id, movie, False, theater); matcher.invalidate()
+    if success: autocomplete_index.watchlist_changed(ctx.author.id, movie, added=True)
     if success: await ctx.respond(f"✅ **{movie}** added to your watchlist.")
     else: await ctx.respond(f"ℹ️ **{movie}** is already on your watchlist.")
 
 @watchlist_commands.command(name="add_regex", description="Add a movie pattern to your watchlist (e.g., '(?i)tron.*').")
-async def watchlist_add_regex(ctx, pattern: str):
+async def watchlist_add_regex(ctx, pattern: str, theater: discord.Option(str, "Only notify for this theater", autocomplete=theater_autocomplete, required=False, default=None)):
     try: re.compile(pattern, re.IGNORECASE)
     except re.error: await ctx.respond("❌ That is not a valid Python Regex pattern.", ephemeral=True); return
-    conn = db.get_connection(); success = db.add_to_watchlist(conn, ctx.author.id, pattern, is_regex=True); conn.close()
+    if _unknown_theater(theater):
+        await ctx.respond(f"❌ Unknown theater '{theater}'.", ephemeral=True); return
+    success = await store.write(db.add_to_watchlist, ctx.author.id, pattern, True, theater); matcher.invalidate()
+    if success: autocomplete_index.watchlist_changed(ctx.author.id, pattern, added=True)
     if success: await ctx.respond(f"✅ Regex pattern `{pattern}` added to your watchlist.")
     else: await ctx.respond(f"ℹ️ Pattern `{pattern}` is already on your watchlist.")
 
 @watchlist_commands.command(name="remove", description="Remove a movie or pattern from your watchlist.")
 async def watchlist_remove(ctx, pattern: discord.Option(str, autocomplete=watchlist_autocomplete)):
-    conn = db.get_connection(); success = db.remove_from_watchlist(conn, ctx.author.id, pattern); conn.close()
+    success = await store.write(db.remove_from_watchlist, ctx.author.id, pattern); matcher.invalidate()
+    if success: autocomplete_index.watchlist_changed(ctx.author.id, pattern, added=False)
     if success: await ctx.respond(f"🗑️ **{pattern}** has been removed from your watchlist.")
     else: await ctx.respond(f"❌ Pattern `{pattern}` not found on your watchlist.")
 
 @watchlist_commands.command(name="view", description="View your watchlist.")
 async def watchlist_view(ctx: discord.ApplicationContext):
-    conn = db.get_connection(); watchlist = db.get_user_watchlist(conn, ctx.author.id); conn.close()
+    watchlist = await store.read(db.get_user_watchlist, ctx.author.id)
     if not watchlist: await ctx.respond("Your watchlist is empty.", ephemeral=True); return
-    description = "\n".join(f"- `{item['pattern']}` {'(Regex)' if item['is_regex'] else ''}" for item in watchlist)
+    description = "\n".join(f"- `{item['pattern']}` {'(Regex)' if item['is_regex'] else ''} {'@ ' + item['theater'] if item['theater'] else ''}" for item in watchlist)
     embed = discord.Embed(title=f"{ctx.author.name}'s Watchlist", description=description, color=discord.Color.blurple())
     await ctx.respond(embed=embed)
 
 @ignore_commands.command(name="add", description="Ignore a movie to stop all processing for it.")
 async def ignore_add(ctx, movie: discord.Option(str, autocomplete=movie_autocomplete)):
-    conn = db.get_connection(); success = db.add_to_ignore_list(conn, ctx.author.id, movie, is_regex=False); conn.close()
+    success = await store.write(db.add_to_ignore_list, ctx.author.id, movie, False); matcher.invalidate()
+    if success: autocomplete_index.ignore_list_changed(ctx.author.id, movie, added=True)
     if success: await ctx.respond(f"🔇 **{movie}** is now on your ignore list. The bot will no longer process updates for it.")
     else: await ctx.respond(f"ℹ️ You are already ignoring **{movie}**.")
 
@@ -254,19 +669,21 @@ async def ignore_add(ctx, movie: discord.Option(str, autocomplete=movie_autocomp
 async def ignore_add_regex(ctx, pattern: str):
     try: re.compile(pattern, re.IGNORECASE)
     except re.error: await ctx.respond("❌ That is not a valid Python Regex pattern.", ephemeral=True); return
-    conn = db.get_connection(); success = db.add_to_ignore_list(conn, ctx.author.id, pattern, is_regex=True); conn.close()
+    success = await store.write(db.add_to_ignore_list, ctx.author.id, pattern, True); matcher.invalidate()
+    if success: autocomplete_index.ignore_list_changed(ctx.author.id, pattern, added=True)
     if success: await ctx.respond(f"🔇 Regex pattern `{pattern}` added to your ignore list. Movies matching this pattern will be ignored.")
     else: await ctx.respond(f"ℹ️ Pattern `{pattern}` is already on your ignore list.")
 
 @ignore_commands.command(name="remove", description="Un-ignore a movie to process its updates again.")
 async def ignore_remove(ctx, pattern: discord.Option(str, autocomplete=ignore_autocomplete)):
-    conn = db.get_connection(); success = db.remove_from_ignore_list(conn, ctx.author.id, pattern); conn.close()
+    success = await store.write(db.remove_from_ignore_list, ctx.author.id, pattern); matcher.invalidate()
+    if success: autocomplete_index.ignore_list_changed(ctx.author.id, pattern, added=False)
     if success: await ctx.respond(f"🔊 **{pattern}** has been removed from your ignore list.")
     else: await ctx.respond(f"❌ You aren't ignoring **{pattern}**.")
 
 @ignore_commands.command(name="view", description="View your personal ignore list.")
 async def ignore_view(ctx: discord.ApplicationContext):
-    conn = db.get_connection(); ignore_list = db.get_user_ignore_list(conn, ctx.author.id); conn.close()
+    ignore_list = await store.read(db.get_user_ignore_list, ctx.author.id)
     if not ignore_list: await ctx.respond("Your ignore list is empty.", ephemeral=True); return
     description = "\n".join(f"- `{item['pattern']}` {'(Regex)' if item['is_regex'] else ''}" for item in ignore_list)
     embed = discord.Embed(title=f"{ctx.author.name}'s Ignore List", description=description, color=discord.Color.dark_red())
@@ -276,4 +693,10 @@ if __name__ == "__main__":
     if any(k in ('', 'YOUR_DISCORD_BOT_TOKEN', 'YOUR_TMDB_API_KEY_HERE') for k in [BOT_TOKEN, TMDB_API_KEY]) or any(c == 0 for c in [DISCORD_CHANNEL_ANIME_ID, DISCORD_CHANNEL_WATCHLIST_ID]):
         print("FATAL: Please fill in your BOT_TOKEN, TMDB_API_KEY, and ALL REQUIRED Channel IDs in main.py!")
     else:
-        bot.run(BOT_TOKEN)
+        # Once per process, before connecting; a database at the current schema version returns right away
+        db.init_db(default_theater=DEFAULT_THEATER)
+        metrics.serve()
+        try: bot.run(BOT_TOKEN)
+        finally:
+            driver_pool.close()
+            store.close()
@@ -0,0 +1,126 @@
+import re
+import threading
+import database as db
+
+_BACKREF = re.compile(r'\\[1-9]')
+# A global inline flag group like '(?x)' or '(?s)'. Inside an alternation Python 3.10 only
+# warns and applies it to the whole expression (3.11+ refuses to compile it)
+_GLOBAL_FLAGS = re.compile(r'(?<!\\)\(\?[aiLmsux]+\)')
+
+# Cached index, rebuilt lazily after any watchlist/ignore list change. get_index runs on
+# reader threads; the generation tells it whether the lists changed while it was reading
+_index = None
+_generation = 0
+_lock = threading.Lock()
+
+class PatternIndex:
+    """
+    Pre-built matcher for the watchlist and ignore list tables.
+    Exact titles live in hash maps and every regex is compiled exactly once,
+    so a whole batch of titles can be checked without touching the database.
+    Watchlist entries may be limited to one theater (theater None = any theater).
+    """
+    def __init__(self, watchlist_rows, ignore_rows):
+        self.watch_exact = {}    # title -> set of (user id, theater)
+        self.watch_regex = {}    # (user id, theater) -> compiled alternation of those patterns
+        self.ignore_exact = set()
+        self.ignore_regex = []   # compiled patterns (or a single combined alternation)
+        self.rejected = []       # (user_id, pattern) rows that failed to compile
+
+        user_patterns = {}
+        for row in watchlist_rows:
+            entry = (row['user_id'], row['theater'])
+            if row['is_regex']:
+                if _compile(row['pattern']) is None:
+                    self.rejected.append((row['user_id'], row['pattern']))
+                    continue
+                user_patterns.setdefault(entry, []).append(row['pattern'])
+            else:
+                self.watch_exact.setdefault(row['pattern'], set()).add(entry)
+        for entry, patterns in user_patterns.items():
+            self.watch_regex[entry] = _combine(patterns)
+
+        ignore_patterns = []
+        for row in ignore_rows:
+            if row['is_regex']:
+                if _compile(row['pattern']) is None:
+                    self.rejected.append((row['user_id'], row['pattern']))
+                    continue
+                ignore_patterns.append(row['pattern'])
+            else:
+                self.ignore_exact.add(row['pattern'])
+        if ignore_patterns:
+            self.ignore_regex = _combine(ignore_patterns)
+
+    def is_ignored(self, title):
+        if title in self.ignore_exact:
+            return True
+        return any(rx.search(title) for rx in self.ignore_regex)
+
+    def watchers(self, title, theater=None):
+        """Users watching the title at `theater`; with theater None, at any theater."""
+        def applies(entry_theater): return theater is None or entry_theater is None or entry_theater == theater
+        watchers = {user_id for user_id, entry_theater in self.watch_exact.get(title, ()) if applies(entry_theater)}
+        for (user_id, entry_theater), compiled in self.watch_regex.items():
+            if user_id not in watchers and applies(entry_theater) and any(rx.search(title) for rx in compiled):
+                watchers.add(user_id)
+        return list(watchers)
+
+    def ignored_titles(self, titles):
+        """Returns the subset of titles that are ignored by any user."""
+        return {title for title in titles if self.is_ignored(title)}
+
+    def watchers_for_titles(self, titles, theater=None):
+        """Returns {title: [user_id, ...]} for every title that has at least one watcher (at `theater`)."""
+        result = {}
+        for title in titles:
+            watchers = self.watchers(title, theater)
+            if watchers:
+                result[title] = watchers
+        return result
+
+def _compile(pattern):
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return None
+
+def _combine(patterns):
+    """
+    Merges patterns into one alternation when possible. Patterns carrying global
+    flags like '(?x)' are matched individually, so the flag can't leak into anyone
+    else's pattern, as are ones using numbered backreferences since merging would
+    renumber their groups.
+    """
+    unique = list(dict.fromkeys(patterns))
+    def mergeable(p): return not _BACKREF.search(p) and not _GLOBAL_FLAGS.search(p)
+    merged = [p for p in unique if mergeable(p)]
+    separate = [p for p in unique if not mergeable(p)]
+    if len(merged) > 1:
+        combined = _compile("|".join(f"(?:{p})" for p in merged))
+        if combined is not None:
+            return [combined] + [_compile(p) for p in separate]
+    return [_compile(p) for p in unique]
+
+def get_index(conn):
+    """
+    Returns the cached PatternIndex, building it from the database if needed. An index
+    built while invalidate() was called may predate the change, so it is used once but
+    not cached.
+    """
+    global _index
+    index, generation = _index, _generation
+    if index is None:
+        index = PatternIndex(db.get_all_watchlist_entries(conn), db.get_all_ignore_entries(conn))
+        if index.rejected:
+            print(f"Skipping {len(index.rejected)} invalid regex pattern(s) in watchlist/ignore lists.")
+        with _lock:
+            if generation == _generation: _index = index
+    return index
+
+def invalidate():
+    """Drops the cached index so the next check rebuilds it."""
+    global _index, _generation
+    with _lock:
+        _generation += 1
+        _index = None
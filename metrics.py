@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+import os
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Optional local metrics endpoint (Prometheus text format at /metrics); 0 keeps it off
+METRICS_PORT = int(os.getenv('METRICS_PORT') or 0)
+METRICS_HOST = os.getenv('METRICS_HOST') or '127.0.0.1'
+METRICS_PREFIX = 'cinemark'
+# Upper bounds (seconds) of the stage timing histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations, plus their count, sum and max."""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+class Registry:
+    """
+    Thread-safe counters and per-stage timing histograms. Timers are used from the
+    event loop and the scraper/database threads alike, so everything goes through one lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}
+        self.started_at = time.time()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None: histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Times the with-block (including any awaits inside it) as one `stage` observation."""
+        start = time.monotonic()
+        try: yield
+        finally: self.observe(stage, time.monotonic() - start)
+
+    def snapshot(self):
+        """Returns ({counter: value}, {stage: (count, total_seconds, max_seconds)})."""
+        with self._lock:
+            return dict(self.counters), {stage: (h.count, h.sum, h.max) for stage, h in self.stages.items()}
+
+    def render(self):
+        """The registry in Prometheus' text exposition format."""
+        with self._lock:
+            lines = []
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE {METRICS_PREFIX}_{name}_total counter", f"{METRICS_PREFIX}_{name}_total {value}"]
+            histogram_name = f"{METRICS_PREFIX}_stage_seconds"
+            if self.stages: lines.append(f"# TYPE {histogram_name} histogram")
+            for stage, h in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + ('+Inf',), h.counts):
+                    cumulative += count
+                    lines.append(f'{histogram_name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{histogram_name}_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{histogram_name}_count{{stage="{stage}"}} {h.count}')
+            lines.append(f"{METRICS_PREFIX}_uptime_seconds {time.time() - self.started_at:.0f}")
+            return "\n".join(lines) + "\n"
+
+class Run:
+    """
+    One check, measured as the difference between registry snapshots taken at its
+    start and end. Anything running alongside it (e.g. /showtimes scrapes) is included.
+    """
+    def __init__(self, registry, kind):
+        self.registry = registry
+        self.kind = kind
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._counters, self._stages = registry.snapshot()
+
+    def finish(self, success, **counts):
+        """Returns the run as a dict ready for database.record_run."""
+        counters, stages = self.registry.snapshot()
+        stage_deltas = {}
+        for stage, (count, total, _) in stages.items():
+            before_count, before_total, _ = self._stages.get(stage, (0, 0.0, 0.0))
+            if count > before_count: stage_deltas[stage] = [count - before_count, round(total - before_total, 3)]
+        counter_deltas = {name: value - self._counters.get(name, 0) for name, value in counters.items() if value != self._counters.get(name, 0)}
+        return dict(counts, kind=self.kind, success=success, started_at=self.started_at,
+                    duration=time.monotonic() - self._start, stages=stage_deltas, counters=counter_deltas)
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404); return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Starts the metrics endpoint on a daemon thread. Returns the server, or None when disabled."""
+    if not port: return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+registry = Registry()
+incr = registry.incr
+observe = registry.observe
+timer = registry.timer
+
+def start_run(kind):
+    return Run(registry, kind)
@@ -0,0 +1,150 @@
+import asyncio
+import time
+import os
+import metrics
+
+# Discord accepts at most 10 embeds (6000 characters of embed text) and 2000 characters of content per message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_CONTENT_CHARS = 2000
+# How long a channel's sender waits for more notifications before packing a message (seconds)
+NOTIFY_BATCH_DELAY = float(os.getenv('NOTIFY_BATCH_DELAY') or 2)
+# Discord's message-send route allows about 5 messages per 5 seconds per channel
+CHANNEL_RATE = 5
+CHANNEL_PER = 5.0
+MAX_SEND_ATTEMPTS = 4
+
+class RateBucket:
+    """Sliding-window limiter for one route: at most `rate` calls per `per` seconds, plus server-imposed pauses."""
+    def __init__(self, rate=CHANNEL_RATE, per=CHANNEL_PER):
+        self.rate = rate
+        self.per = per
+        self._calls = []
+        self._blocked_until = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._calls = [t for t in self._calls if now - t < self.per]
+            wait = self._blocked_until - now
+            if wait <= 0 and len(self._calls) >= self.rate:
+                wait = self.per - (now - self._calls[0])
+            if wait <= 0:
+                self._calls.append(now)
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, seconds):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+def _retry_after(error):
+    """Seconds to back off for a 429 response, or None if the error isn't a rate limit."""
+    if getattr(error, 'status', None) != 429: return None
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is None:
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        retry_after = headers.get('Retry-After')
+    try: return float(retry_after)
+    except (TypeError, ValueError): return 1.0
+
+class Notifier:
+    """
+    Background notification queue. Each channel gets its own sender task that packs
+    queued embeds into as few messages as Discord allows, pings every mentioned user
+    once per message, and paces itself with a per-channel rate bucket. Channels are
+    resolved from the client's cache before falling back to a REST fetch, and kept.
+
+    `client` only needs get_channel(id), async fetch_channel(id), and channels with
+    async send(content=..., embeds=[...]), so a fake client works for testing.
+    """
+    def __init__(self, client, batch_delay=NOTIFY_BATCH_DELAY):
+        self.client = client
+        self.batch_delay = batch_delay
+        self._channels = {}
+        self._pending = {}   # channel_id -> [[key, embed, mentions]]
+        self._buckets = {}
+        self._senders = {}
+        self.sent_messages = 0
+
+    def notify(self, channel_id, embed, mentions=(), key=None):
+        """
+        Queues an embed without blocking. Notifications for the same `key` (usually
+        the movie URL) in the same channel are packed together, and their mentions merged.
+        """
+        if not channel_id: return
+        key = key or embed.url or embed.title
+        pending = self._pending.setdefault(channel_id, [])
+        earlier = next((item for item in pending if item[0] == key), None)
+        if earlier is not None:
+            earlier[2].update(mentions)
+            pending.append([key, embed, set()])
+        else:
+            pending.append([key, embed, set(mentions)])
+        sender = self._senders.get(channel_id)
+        if sender is None or sender.done():
+            self._senders[channel_id] = asyncio.ensure_future(self._run_sender(channel_id))
+
+    async def drain(self, timeout=None):
+        """Waits until everything queued so far has been sent (or dropped after errors)."""
+        senders = [task for task in self._senders.values() if not task.done()]
+        if senders: await asyncio.wait(senders, timeout=timeout)
+
+    async def _get_channel(self, channel_id):
+        channel = self._channels.get(channel_id) or self.client.get_channel(channel_id)
+        if channel is None:
+            channel = await self.client.fetch_channel(channel_id)
+        self._channels[channel_id] = channel
+        return channel
+
+    def _take_message(self, channel_id):
+        """Pops the next message's worth of queued items, keeping same-key items together."""
+        pending = self._pending.get(channel_id, [])
+        order = list(dict.fromkeys(item[0] for item in pending))
+        pending.sort(key=lambda item: order.index(item[0]))
+        batch, embed_chars, mentions = [], 0, set()
+        while pending and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            key, embed, item_mentions = pending[0]
+            size = len(embed)
+            content = _mention_text(mentions | item_mentions)
+            if batch and (embed_chars + size > MAX_EMBED_CHARS_PER_MESSAGE or len(content) > MAX_CONTENT_CHARS):
+                break
+            batch.append(pending.pop(0))
+            embed_chars += size
+            mentions |= item_mentions
+        return [embed for _, embed, _ in batch], _mention_text(mentions) or None
+
+    async def _run_sender(self, channel_id):
+        bucket = self._buckets.setdefault(channel_id, RateBucket())
+        while self._pending.get(channel_id):
+            # Give the rest of a check a moment to queue up so messages fill up
+            await asyncio.sleep(self.batch_delay)
+            embeds, content = self._take_message(channel_id)
+            await self._send(channel_id, bucket, embeds, content)
+
+    async def _send(self, channel_id, bucket, embeds, content):
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            await bucket.acquire()
+            try:
+                channel = await self._get_channel(channel_id)
+                with metrics.timer('notify_send'):
+                    await channel.send(content=content, embeds=embeds)
+                self.sent_messages += 1
+                metrics.incr('notifications_sent')
+                print(f"    -> Sent {len(embeds)} notification(s) to channel #{getattr(channel, 'name', channel_id)}.")
+                return
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is None:
+                    # The channel may have been deleted or become inaccessible; resolve it again next time
+                    self._channels.pop(channel_id, None)
+                    metrics.incr('notification_errors')
+                    print(f"    -> ERROR sending notification: {e}")
+                    return
+                metrics.incr('notify_rate_limited')
+                print(f"    -> Rate limited on channel {channel_id}, retrying in {retry_after:.1f}s...")
+                bucket.block(retry_after)
+        metrics.incr('notification_errors')
+        print(f"    -> ERROR sending notification: still rate limited after {MAX_SEND_ATTEMPTS} attempts, dropping {len(embeds)} embed(s).")
+
+def _mention_text(user_ids):
+    return " ".join(f"<@{user_id}>" for user_id in sorted(user_ids))
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import metrics
+
+# Items waiting in front of each check stage; a full queue makes the stage before it wait
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE') or 50)
+
+_DONE = object()
+
+class Stage:
+    """
+    A bounded queue drained by `workers` tasks. Each task takes whatever is waiting, up
+    to `batch_size` items, and awaits handler(batch); the time spent is recorded as the
+    `check.<name>` stage.
+    """
+    def __init__(self, pipeline, name, handler, workers=1, batch_size=1, queue_size=PIPELINE_QUEUE_SIZE):
+        self.pipeline = pipeline
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue(queue_size)
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(max(1, workers))]
+
+    async def put(self, item):
+        await self.queue.put(item)
+
+    async def close(self):
+        """Lets the workers finish what is queued, then waits for them."""
+        for _ in self.tasks: await self.queue.put(_DONE)
+        await asyncio.gather(*self.tasks)
+
+    async def _work(self):
+        try:
+            while True:
+                batch, item = [], await self.queue.get()
+                while item is not _DONE:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size or self.queue.empty(): break
+                    item = self.queue.get_nowait()
+                if batch:
+                    with metrics.timer(f'check.{self.name}'): await self.handler(batch)
+                # Every worker consumes exactly one _DONE
+                if item is _DONE: return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.pipeline.fail(e)
+            raise
+
+class Pipeline:
+    """
+    Stages connected by bounded queues, all running at once. The first error in any
+    stage fails the whole pipeline and cancels the rest, so a stalled producer can't
+    wait forever on a queue nobody drains anymore.
+    """
+    def __init__(self):
+        self.stages = []
+        self._failed = asyncio.get_running_loop().create_future()
+
+    def stage(self, name, handler, workers=1, batch_size=1):
+        stage = Stage(self, name, handler, workers, batch_size)
+        self.stages.append(stage)
+        return stage
+
+    def fail(self, error):
+        if not self._failed.done(): self._failed.set_exception(error)
+
+    async def run(self, feed):
+        """Runs the `feed` coroutine, which puts work in and closes the stages in order, and returns its result."""
+        main = asyncio.ensure_future(feed)
+        try:
+            await asyncio.wait([main, self._failed], return_when=asyncio.FIRST_COMPLETED)
+            if self._failed.done(): return self._failed.result()
+            return main.result()
+        finally:
+            for task in [main, self._failed] + [task for stage in self.stages for task in stage.tasks]:
+                if not task.done(): task.cancel()
+                elif not task.cancelled(): task.exception()  # already surfaced once; don't log it again
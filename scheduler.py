@@ -0,0 +1,125 @@
+import heapq
+import time
+import os
+from collections import deque
+from datetime import datetime, date
+
+# Movie-page visits allowed per rolling hour, across scheduled refreshes and list polls
+SCRAPE_BUDGET_PER_HOUR = int(os.getenv('SCRAPE_BUDGET_PER_HOUR') or 60)
+LIST_POLL_HOURS = float(os.getenv('LIST_POLL_HOURS') or 6)
+SCHEDULER_TICK_MINUTES = float(os.getenv('SCHEDULER_TICK_MINUTES') or 5)
+# Most movie pages a single tick visits, so work trickles out instead of bursting
+SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE') or 4)
+RETRY_SECONDS = 30 * 60
+
+# (days until release, hours between showtime refreshes); the first bracket that fits wins
+REFRESH_BRACKETS = [(7, 6), (30, 12), (90, 24)]
+FAR_REFRESH_HOURS = 72
+MIN_REFRESH_HOURS = 1
+
+def refresh_interval(release_date, watchers=0, is_anime=False, today=None):
+    """
+    Seconds between showtime refreshes for a movie. Titles close to (or past) release
+    refresh most often; each watcher up to three shortens the interval, and anime halves it.
+    """
+    today = today or date.today()
+    try: days = (datetime.strptime(release_date, '%Y-%m-%d').date() - today).days
+    except (TypeError, ValueError): days = None
+    hours = FAR_REFRESH_HOURS
+    if days is not None:
+        for max_days, bracket_hours in REFRESH_BRACKETS:
+            if days <= max_days:
+                hours = bracket_hours
+                break
+    hours /= 1 + min(watchers, 3)
+    if is_anime: hours /= 2
+    return max(hours, MIN_REFRESH_HOURS) * 3600
+
+class RefreshScheduler:
+    """
+    Priority queue of showtime refresh deadlines per (theater, title) key, kept as a
+    heap with lazy deletion, plus the list pages' own polling cadence and a rolling
+    hourly budget of page visits.
+    """
+    def __init__(self, budget_per_hour=SCRAPE_BUDGET_PER_HOUR, list_interval=LIST_POLL_HOURS * 3600):
+        self.budget_per_hour = budget_per_hour
+        self.list_interval = list_interval
+        self.next_list_poll = 0
+        self._heap = []
+        self._deadlines = {}
+        self._spent = deque()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def __iter__(self):
+        return iter(list(self._deadlines))
+
+    def schedule(self, key, deadline):
+        """Sets (or moves) a refresh deadline, as a time.time() timestamp."""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+
+    def retain(self, keys):
+        """Forgets every key not in `keys`, e.g. movies no longer listed or watched."""
+        for key in [key for key in self._deadlines if key not in keys]:
+            del self._deadlines[key]
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def budget_left(self, now=None):
+        now = now or time.time()
+        while self._spent and now - self._spent[0] >= 3600:
+            self._spent.popleft()
+        return max(0, self.budget_per_hour - len(self._spent))
+
+    def due_count(self, now=None):
+        now = now or time.time()
+        return sum(1 for deadline in self._deadlines.values() if deadline <= now)
+
+    def take_due(self, limit=None, now=None):
+        """
+        Pops the most overdue movies, up to `limit` and the remaining hourly budget, and
+        charges them to the budget. Taken movies leave the queue until rescheduled.
+        """
+        now = now or time.time()
+        allowed = self.budget_left(now) if limit is None else min(limit, self.budget_left(now))
+        taken = []
+        while len(taken) < allowed:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now: break
+            _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            taken.append(key)
+            self._spent.append(now)
+        return taken
+
+    def offer(self, key, deadline=None, now=None):
+        """
+        take_due for a single key, for movies that stream in one at a time: (re)schedules
+        it at `deadline` (or keeps its current one) and takes it right away if it is due
+        and the budget allows. Returns whether it was taken.
+        """
+        now = now or time.time()
+        if deadline is not None: self.schedule(key, deadline)
+        if key not in self._deadlines or self._deadlines[key] > now or not self.budget_left(now): return False
+        del self._deadlines[key]
+        self._spent.append(now)
+        return True
+
+    def list_due(self, now=None):
+        return (now or time.time()) >= self.next_list_poll
+
+    def list_polled(self, now=None):
+        self.next_list_poll = (now or time.time()) + self.list_interval
+
+    def enqueue_all(self):
+        """Makes the list pages and every tracked movie due right away."""
+        self.next_list_poll = 0
+        for key in list(self._deadlines):
+            self.schedule(key, 0)
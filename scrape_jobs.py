@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Selenium work runs on these threads so the Discord event loop never blocks on it. A check
+# holds one per theater loading its list pages plus one per movie page being scraped.
+SCRAPER_WORKERS = int(os.getenv('SCRAPER_WORKERS') or 4)
+_executor = ThreadPoolExecutor(max_workers=SCRAPER_WORKERS, thread_name_prefix='scraper')
+
+class ScrapeCancelled(Exception):
+    """Raised inside a scraping function once its job has been cancelled or timed out."""
+
+class ScrapeJob:
+    """
+    Handle shared between the event loop and a scraping function running on a
+    worker thread. The worker side reports progress and partial results, and
+    polls for cancellation; the loop side consumes those events and awaits the
+    final result.
+    """
+    def __init__(self, loop, name):
+        self.name = name
+        self.timed_out = False
+        self.future = None
+        self.deadline = None
+        self._loop = loop
+        self._events = asyncio.Queue()
+        self._cancelled = threading.Event()
+
+    # --- Worker-thread side ---
+    def report(self, message):
+        """Streams a progress message back to the event loop."""
+        self._put(('progress', message))
+
+    def emit(self, item):
+        """Streams a partial result back to the event loop."""
+        self._put(('item', item))
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise ScrapeCancelled(f"Scrape job '{self.name}' was {'timed out' if self.timed_out else 'cancelled'}.")
+
+    def sleep(self, seconds):
+        """time.sleep() that wakes up early and raises if the job is cancelled."""
+        self._cancelled.wait(seconds)
+        self.check_cancelled()
+
+    def _put(self, event):
+        self._loop.call_soon_threadsafe(self._events.put_nowait, event)
+
+    # --- Event-loop side ---
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _remaining(self):
+        return None if self.deadline is None else max(0, self.deadline - self._loop.time())
+
+    def _time_out(self):
+        self.timed_out = True
+        self.cancel()
+        return asyncio.TimeoutError(f"Scrape job '{self.name}' timed out.")
+
+    async def events(self):
+        """
+        Yields (kind, payload) tuples - 'progress' or 'item' - until the job finishes
+        or its timeout expires.
+        """
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(self._events.get(), self._remaining())
+            except asyncio.TimeoutError:
+                self._time_out()
+                return
+            if kind == 'done':
+                return
+            yield kind, payload
+
+    async def result(self):
+        """
+        Waits for the job and returns its result. Raises asyncio.TimeoutError once the
+        timeout expires; the worker is told to stop but the caller doesn't wait for it.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.future), self._remaining())
+        except asyncio.TimeoutError:
+            raise self._time_out()
+        except ScrapeCancelled:
+            if self.timed_out:
+                raise asyncio.TimeoutError(f"Scrape job '{self.name}' timed out.")
+            raise
+        except asyncio.CancelledError:
+            # The awaiting task was cancelled; ask the worker to stop too
+            self.cancel()
+            raise
+
+def _run_job(job, fn, args, kwargs):
+    try:
+        job.check_cancelled()
+        return fn(*args, job=job, **kwargs)
+    finally:
+        job._put(('done', None))
+
+def start_job(fn, *args, name=None, timeout=None, **kwargs):
+    """
+    Runs fn(*args, job=job, **kwargs) on the scraper executor and returns its
+    ScrapeJob. Must be called from the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    job = ScrapeJob(loop, name or fn.__name__)
+    if timeout:
+        job.deadline = loop.time() + timeout
+    job.future = loop.run_in_executor(_executor, _run_job, job, fn, args, kwargs)
+    # Abandoned (timed out / cancelled) jobs still finish; don't log their exception as unretrieved
+    job.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return job
@@ -1,44 +1,122 @@
-import re
-import requests
 import time
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
+import threading
+from collections import deque
 from datetime import datetime
+from scrape_jobs import ScrapeCancelled
+import metrics
 import os
 
-ANIME_KEYWORD_ID = 210024
 THEATER_URL = os.getenv('THEATER_URL')
+# Comma-separated theater pages for running several theaters in one process; THEATER_URL alone still works
+THEATER_URLS = [url.strip() for url in (os.getenv('THEATER_URLS') or THEATER_URL or '').split(',') if url.strip()]
+DEFAULT_THEATER_URL = THEATER_URLS[0] if THEATER_URLS else None
 COMING_SOON_URL = "https://www.cinemark.com/movies/coming-soon"
 NOW_PLAYING_URL = "https://www.cinemark.com/movies/now-playing"
 EVENTS_URL = "https://www.cinemark.com/movies/events"
 
-# Known anime studios and distributors for fallback detection
-ANIME_STUDIOS = [
-    'studio ghibli', 'toei animation', 'madhouse', 'pierrot', 'bones', 'mappa',
-    'wit studio', 'trigger', 'kyoani', 'kyoto animation', 'a-1 pictures',
-    'cloverworks', 'ufotable', 'production i.g', 'sunrise', 'shaft',
-    'j.c.staff', 'white fox', 'doga kobo', 'studio deen', 'gonzo'
-]
-
-ANIME_DISTRIBUTORS = [
-    'funimation', 'crunchyroll', 'aniplex', 'viz media', 'sentai filmworks',
-    'eleven arts', 'shout factory', 'discotek media'
-]
-
-def scrape_all_movies(driver):
-    driver.get(THEATER_URL)
-    print("Setting theater location...")
-    time.sleep(5)
-    coming_soon = _scrape_movie_list_page(driver, COMING_SOON_URL, "Coming Soon")
-    now_playing = _scrape_movie_list_page(driver, NOW_PLAYING_URL, "Now Playing")
-    events = _scrape_movie_list_page(driver, EVENTS_URL, "Events")
+# Per-step readiness timeouts (seconds). Waits end as soon as the content is present.
+THEATER_PAGE_TIMEOUT = float(os.getenv('THEATER_PAGE_TIMEOUT') or 15)
+LIST_PAGE_TIMEOUT = float(os.getenv('LIST_PAGE_TIMEOUT') or 15)
+MOVIE_PAGE_TIMEOUT = float(os.getenv('MOVIE_PAGE_TIMEOUT') or 10)
+DATE_CLICK_TIMEOUT = float(os.getenv('DATE_CLICK_TIMEOUT') or 5)
+# A fully loaded movie page without a date carousel after this long has no showtimes
+MOVIE_PAGE_SETTLE = 1.0
+WAIT_POLL_INTERVAL = 0.1
+
+# Bound by _import_selenium() when a browser scrape starts; theater_id, the URLs and the
+# wait stats are used by every process, most of which never drive a browser
+By = NoSuchElementException = StaleElementReferenceException = WebDriverException = None
+
+def _import_selenium():
+    global By, NoSuchElementException, StaleElementReferenceException, WebDriverException
+    if By is None:
+        from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, WebDriverException
+        from selenium.webdriver.common.by import By
+
+def _sleep(job, seconds):
+    if job: job.sleep(seconds)
+    else: time.sleep(seconds)
+
+def report_progress(job, message):
+    print(message)
+    if job: job.report(message.strip())
+
+# --- Readiness Waits ---
+# Most recent observed waits per step as (seconds, timed_out), for tuning the timeouts above
+wait_timings = {}
+_wait_lock = threading.Lock()
+
+def _wait_until(step, condition, timeout, job=None):
+    """
+    Polls condition(elapsed) until it returns something truthy or the timeout expires.
+    The observed wait is recorded under `step`. Returns whether the condition was met.
+    """
+    start = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - start
+        try: ready = condition(elapsed)
+        except WebDriverException: ready = False
+        if ready or elapsed >= timeout: break
+        _sleep(job, WAIT_POLL_INTERVAL)
+    with _wait_lock:
+        wait_timings.setdefault(step, deque(maxlen=500)).append((elapsed, not ready))
+    if not ready: metrics.incr(f'wait_timeouts:{step}')
+    return bool(ready)
+
+def get_wait_stats():
+    """Summarizes recorded waits as {step: {'count', 'avg', 'max', 'timeouts'}}."""
+    with _wait_lock:
+        snapshot = {step: list(samples) for step, samples in wait_timings.items()}
+    return {
+        step: {
+            'count': len(samples),
+            'avg': sum(s for s, _ in samples) / len(samples),
+            'max': max(s for s, _ in samples),
+            'timeouts': sum(1 for _, timed_out in samples if timed_out),
+        }
+        for step, samples in snapshot.items() if samples
+    }
+
+def _document_ready(driver):
+    return driver.execute_script("return document.readyState") == 'complete'
+
+def _theater_list_signature(driver):
+    """Cheap hash of #theaterList's markup, used to notice when a date click re-renders it."""
+    return driver.execute_script("""
+        var el = document.querySelector('#theaterList');
+        if (!el) return null;
+        var s = el.innerHTML, h = 0;
+        for (var i = 0; i < s.length; i++) { h = (h * 31 + s.charCodeAt(i)) | 0; }
+        return h;
+    """)
+
+def theater_id(theater_url):
+    """Short, stable key for a theater: the last path segment of its page URL."""
+    return theater_url.rstrip('/').rsplit('/', 1)[-1] if theater_url else ''
+
+def _set_theater(driver, theater_url, job=None):
+    # Pooled drivers keep their location cookies, so the warm-up is only needed when the theater changes
+    if getattr(driver, 'theater_url', None) != theater_url:
+        with metrics.timer('page_load:theater'):
+            driver.get(theater_url)
+            report_progress(job, f"Setting theater location to {theater_id(theater_url)}...")
+            _wait_until('theater_page', lambda _: _document_ready(driver), THEATER_PAGE_TIMEOUT, job)
+        driver.theater_url = theater_url
+
+def scrape_all_movies(driver, job=None, theater_url=None):
+    _import_selenium()
+    _set_theater(driver, theater_url or DEFAULT_THEATER_URL, job)
+    coming_soon = _scrape_movie_list_page(driver, COMING_SOON_URL, "Coming Soon", job)
+    now_playing = _scrape_movie_list_page(driver, NOW_PLAYING_URL, "Now Playing", job)
+    events = _scrape_movie_list_page(driver, EVENTS_URL, "Events", job)
     all_movies = {movie['title']: movie for movie in coming_soon + now_playing + events}
     return list(all_movies.values())
 
-def _scrape_movie_list_page(driver, url, page_name):
-    print(f"\nNavigating to '{page_name}' page: {url}")
-    driver.get(url)
-    time.sleep(10)
+def _scrape_movie_list_page(driver, url, page_name, job=None):
+    report_progress(job, f"\nNavigating to '{page_name}' page: {url}")
+    with metrics.timer('page_load:list'):
+        driver.get(url)
+        _wait_until('list_page', lambda _: driver.find_elements(By.CLASS_NAME, 'movieBlock'), LIST_PAGE_TIMEOUT, job)
     print(f"Scraping movie data from '{page_name}' page...")
     movie_blocks = driver.find_elements(By.CLASS_NAME, 'movieBlock')
     movies_data = []
@@ -54,123 +132,45 @@ def _scrape_movie_list_page(driver, url, page_name):
             except (ValueError, TypeError): formatted_date = "N/A"
             movies_data.append({'title': title, 'release_date': formatted_date, 'cinemark_url': movie_url, 'poster_url': poster_url})
         except Exception: continue
-    print(f"Found {len(movies_data)} movies on this page.")
+    report_progress(job, f"Found {len(movies_data)} movies on '{page_name}' page.")
+    if job: job.emit(movies_data)
     return movies_data
 
-def get_specific_showtimes(driver, movie_url):
+def get_specific_showtimes(driver, movie_url, job=None, theater_url=None):
     if not movie_url or 'cinemark.com' not in movie_url: return {"Error": "Invalid URL"}
+    _import_selenium()
+    # The movie page lists times for whichever theater the browser's location cookie points at
+    _set_theater(driver, theater_url or DEFAULT_THEATER_URL, job)
     print(f"    -> Visiting movie page for specific showtimes: {movie_url}")
-    driver.get(movie_url)
-    time.sleep(5)
+    with metrics.timer('page_load:movie'):
+        driver.get(movie_url)
+        _wait_until('movie_page', lambda elapsed: (
+            driver.find_elements(By.CSS_SELECTOR, '#showdatesCarousel .showdate-link')
+            or (elapsed >= MOVIE_PAGE_SETTLE and _document_ready(driver) and not driver.find_elements(By.ID, 'showdatesCarousel'))
+        ), MOVIE_PAGE_TIMEOUT, job)
     showtimes_by_date = {}
     try:
         date_links = driver.find_elements(By.CSS_SELECTOR, '#showdatesCarousel .showdate-link')
         if not date_links: return {"Notice": "Showtimes not available yet."}
         for i in range(len(date_links)):
-            current_date_link = driver.find_elements(By.CSS_SELECTOR, '#showdatesCarousel .showdate-link')[i]
-            date_text = current_date_link.text.replace('\n', ' ')
-            current_date_link.click(); time.sleep(2)
+            with metrics.timer('date_click'):
+                before = _theater_list_signature(driver)
+                try:
+                    date_text = date_links[i].text.replace('\n', ' ')
+                    date_links[i].click()
+                except StaleElementReferenceException:
+                    # The carousel was re-rendered; only then is it worth querying it again
+                    date_links = driver.find_elements(By.CSS_SELECTOR, '#showdatesCarousel .showdate-link')
+                    date_text = date_links[i].text.replace('\n', ' ')
+                    date_links[i].click()
+                if i == 0:
+                    # The first date is usually pre-selected, so its listing may not re-render
+                    _wait_until('date_click', lambda _: driver.find_elements(By.CSS_SELECTOR, '#theaterList .showtime-link'), DATE_CLICK_TIMEOUT, job)
+                else:
+                    _wait_until('date_click', lambda _: _theater_list_signature(driver) not in (before, None), DATE_CLICK_TIMEOUT, job)
             time_elements = driver.find_elements(By.CSS_SELECTOR, '#theaterList .showtime-link')
             times = [t.text for t in time_elements if t.text]
             if times: showtimes_by_date[date_text] = sorted(list(set(times)))
         return showtimes_by_date if showtimes_by_date else {"Notice": "No showtimes listed for available dates."}
+    except ScrapeCancelled: raise
     except Exception: return {"Error": "Could not scrape showtimes."}
-
-def clean_movie_title(title):
-    """Clean movie title for TMDB search, removing format indicators and event suffixes."""
-    cleaned = re.sub(r'\s*\(.*\)', '', title).strip()
-    
-    # Remove quality indicators like "4K", "IMAX", "3D", etc.
-    cleaned = re.sub(r'\s+(4K|IMAX|3D|HDR|Dolby)\b', '', cleaned, flags=re.IGNORECASE).strip()
-    
-    if ':' in cleaned:
-        base, edition = cleaned.split(':', 1)
-        if any(kw in edition.lower() for kw in ['anniversary', 'imax', 'exclusive', 'remastered', "director's cut", 'fathom']):
-            return base.strip()
-    
-    if '|' in cleaned:
-        base, edition = cleaned.split('|', 1)
-        if any(kw in edition.lower() for kw in ['studio ghibli fest', 'ghibli fest', 'anime night', 'fathom events']):
-            return base.strip()
-    
-    return cleaned
-
-def is_anime_by_title_patterns(original_title, cleaned_title):
-    """Check if a movie is anime based on title patterns and known indicators."""
-    original_lower = original_title.lower()
-    cleaned_lower = cleaned_title.lower()
-    
-    # Check for Studio Ghibli specifically
-    if 'studio ghibli' in original_lower or 'ghibli' in original_lower:
-        return True
-    
-    # Check for known anime studios in the title
-    for studio in ANIME_STUDIOS:
-        if studio in original_lower:
-            return True
-    
-    # Check for known anime distributors
-    for distributor in ANIME_DISTRIBUTORS:
-        if distributor in original_lower:
-            return True
-    
-    # Check for anime-specific patterns
-    anime_patterns = [
-        r'japanese\s+with\s+english\s+subtitles',
-        r'english\s+dub(bed)?',
-        r'anime\s+(movie|film|night)',
-        r'(sub|dub)\s*\|',
-        r'\|\s*(sub|dub)',
-    ]
-    
-    for pattern in anime_patterns:
-        if re.search(pattern, original_lower):
-            return True
-    
-    return False
-
-def get_tmdb_details(title, api_key):
-    """Fetches details, checks for anime keyword, and gets overview in one go."""
-    cleaned_title = clean_movie_title(title)
-    
-    # First check if it's anime by title patterns (fallback detection)
-    is_anime_by_pattern = is_anime_by_title_patterns(title, cleaned_title)
-    
-    try:
-        search_url = f"https://api.themoviedb.org/3/search/movie?api_key={api_key}&query={cleaned_title}"
-        search_res = requests.get(search_url); search_res.raise_for_status()
-        results = search_res.json()['results']
-        if not results: 
-            # If no results but we detected anime by pattern, still return as anime
-            if is_anime_by_pattern:
-                return None, True, "Animation", "Anime movie detected by title pattern."
-            return None, False, "N/A", "N/A"
-
-        movie_details = results[0]
-        movie_id = movie_details.get('id')
-        
-        # Get overview and truncate if necessary
-        overview = movie_details.get('overview', 'No description available.')
-        if len(overview) > 500:
-            overview = overview[:497] + '...'
-
-        genres_url = f"https://api.themoviedb.org/3/genre/movie/list?api_key={api_key}"
-        genres_res = requests.get(genres_url); genres_res.raise_for_status()
-        genre_map = {g['id']: g['name'] for g in genres_res.json()['genres']}
-        genres = [genre_map.get(gid, '?') for gid in movie_details.get('genre_ids', [])]
-
-        is_anime_by_keyword = False
-        if movie_id:
-            keywords_url = f"https://api.themoviedb.org/3/movie/{movie_id}/keywords?api_key={api_key}"
-            kw_res = requests.get(keywords_url); kw_res.raise_for_status()
-            is_anime_by_keyword = any(kw['id'] == ANIME_KEYWORD_ID for kw in kw_res.json().get('keywords', []))
-        
-        # Final anime determination: either TMDB keyword OR pattern detection
-        is_anime = is_anime_by_keyword or is_anime_by_pattern
-        
-        return movie_details, is_anime, ", ".join(genres), overview
-    except requests.exceptions.RequestException:
-        # If API fails but we detected anime by pattern, still return as anime
-        if is_anime_by_pattern:
-            return None, True, "Animation", "Anime movie detected by title pattern (API error)."
-        return None, False, "API Error", "API Error"
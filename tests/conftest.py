@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+sys.path.insert(0, ROOT)
+
+import backends
+import scraper
+
+LIST_PAGE_NAMES = [('coming-soon', "Coming Soon"), ('now-playing', "Now Playing"), ('events', "Events")]
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+class Site:
+    """The saved Cinemark pages under tests/fixtures, reachable at `base` (…/cinemark.com)."""
+    def __init__(self, base):
+        self.base = base
+        self.theater_url = f"{base}/theaters/test-theater.html"
+
+    def movie_url(self, slug):
+        return f"{self.base}/movies/{slug}.html"
+
+    def use(self, monkeypatch):
+        """Points the list page URLs of both backends at this copy of the site."""
+        urls = [(self.movie_url(slug), name) for slug, name in LIST_PAGE_NAMES]
+        monkeypatch.setattr(scraper, 'COMING_SOON_URL', urls[0][0])
+        monkeypatch.setattr(scraper, 'NOW_PLAYING_URL', urls[1][0])
+        monkeypatch.setattr(scraper, 'EVENTS_URL', urls[2][0])
+        monkeypatch.setattr(backends, 'LIST_PAGES', urls)
+
+@pytest.fixture(scope='session')
+def http_site():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(_QuietHandler, directory=FIXTURES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield Site(f"http://127.0.0.1:{server.server_address[1]}/cinemark.com")
+    server.shutdown()
+
+@pytest.fixture(scope='session')
+def driver_pool():
+    if not any(shutil.which(name) for name in ('google-chrome', 'chromium', 'chromium-browser', 'chrome')):
+        pytest.skip("Chrome is not installed; the Selenium backend is not tested.")
+    from driver_pool import DriverPool
+    pool = DriverPool(size=1)
+    yield pool
+    pool.close()
+
+@pytest.fixture(params=['http', 'selenium'])
+def backend_and_site(request, monkeypatch):
+    """Each backend with the site it reads: HTTP from a local server, Selenium straight from file:// URLs."""
+    if request.param == 'http':
+        site = request.getfixturevalue('http_site')
+        backend = backends.HttpBackend(workers=1, fallback=None)
+    else:
+        site = Site('file://' + os.path.join(FIXTURES, 'cinemark.com'))
+        backend = backends.SeleniumBackend(request.getfixturevalue('driver_pool'))
+        # Static pages are complete once loaded; don't wait out the live site's timeouts
+        monkeypatch.setattr(scraper, 'MOVIE_PAGE_TIMEOUT', 2)
+    site.use(monkeypatch)
+    return backend, site
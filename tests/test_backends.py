@@ -0,0 +1,86 @@
+import os
+import backends
+import cinemark_html
+from conftest import FIXTURES
+
+def _read(name):
+    with open(os.path.join(FIXTURES, 'cinemark.com', 'movies', name)) as f: return f.read()
+
+def _expected_movies(site):
+    return {
+        "Spirited Away": {'title': "Spirited Away", 'release_date': '2025-10-17', 'cinemark_url': site.movie_url('spirited-away'), 'poster_url': "https://images.cinemark.com/posters/spirited-away.jpg"},
+        "Winter Story": {'title': "Winter Story", 'release_date': '2025-12-25', 'cinemark_url': site.movie_url('winter-story'), 'poster_url': "https://images.cinemark.com/posters/winter-story.jpg"},
+        "Client Rendered": {'title': "Client Rendered", 'release_date': '2025-09-05', 'cinemark_url': site.movie_url('client-rendered'), 'poster_url': "https://images.cinemark.com/posters/client-rendered.jpg"},
+        "Anime Night | Fan Event": {'title': "Anime Night | Fan Event", 'release_date': 'N/A', 'cinemark_url': site.movie_url('anime-night'), 'poster_url': "https://images.cinemark.com/posters/anime-night.jpg"},
+    }
+
+# --- Shared suite: every backend must pass these ---
+def test_scrape_all_movies(backend_and_site):
+    backend, site = backend_and_site
+    movies = backend.scrape_all_movies(theater_url=site.theater_url)
+    assert len(movies) == 4
+    assert {movie['title']: movie for movie in movies} == _expected_movies(site)
+
+def test_showtimes_for_every_date(backend_and_site):
+    backend, site = backend_and_site
+    showtimes = backend.get_specific_showtimes(site.movie_url('spirited-away'), theater_url=site.theater_url)
+    assert showtimes == {"Fri Oct 17": ['4:30pm', '7:00pm'], "Sat Oct 18": ['1:00pm', '9:15pm']}
+
+def test_showtimes_not_listed_yet(backend_and_site):
+    backend, site = backend_and_site
+    showtimes = backend.get_specific_showtimes(site.movie_url('winter-story'), theater_url=site.theater_url)
+    assert showtimes == {"Notice": "Showtimes not available yet."}
+
+def test_rejects_foreign_urls(backend_and_site):
+    backend, site = backend_and_site
+    assert backend.get_specific_showtimes("https://example.com/movies/x", theater_url=site.theater_url) == {"Error": "Invalid URL"}
+
+# --- HTTP backend ---
+class _Fallback:
+    name = 'stub'
+    def __init__(self): self.calls = []
+    def get_specific_showtimes(self, movie_url, job=None, theater_url=None):
+        self.calls.append(movie_url)
+        return {"Fri Oct 17": ['8:00pm']}
+
+def test_http_falls_back_when_the_page_is_rendered_client_side(http_site, monkeypatch):
+    http_site.use(monkeypatch)
+    fallback = _Fallback()
+    backend = backends.HttpBackend(workers=1, fallback=fallback)
+    url = http_site.movie_url('client-rendered')
+    assert backend.get_specific_showtimes(url, theater_url=http_site.theater_url) == {"Fri Oct 17": ['8:00pm']}
+    assert fallback.calls == [url]
+
+def test_http_streams_each_list_page(http_site, monkeypatch):
+    http_site.use(monkeypatch)
+    class Job:
+        pages = []
+        def emit(self, item): self.pages.append([movie['title'] for movie in item])
+        def report(self, message): pass
+        def check_cancelled(self): pass
+    backends.HttpBackend(workers=1).scrape_all_movies(job=Job(), theater_url=http_site.theater_url)
+    assert Job.pages == [["Spirited Away", "Winter Story"], ["Client Rendered", "Spirited Away"], ["Anime Night | Fan Event"]]
+
+# --- cinemark_html parsers ---
+def test_parse_movie_list_resolves_links_and_skips_broken_blocks():
+    movies = cinemark_html.parse_movie_list(_read('coming-soon.html'), "https://www.cinemark.com/movies/coming-soon")
+    assert [movie['title'] for movie in movies] == ["Spirited Away", "Winter Story"]
+    assert movies[0]['cinemark_url'] == "https://www.cinemark.com/movies/spirited-away.html"
+    assert movies[1]['poster_url'] == "https://images.cinemark.com/posters/winter-story.jpg"
+
+def test_parse_show_dates():
+    dates = cinemark_html.parse_show_dates(_read('spirited-away.html'), "https://www.cinemark.com/movies/spirited-away")
+    assert dates == [("Fri Oct 17", "https://www.cinemark.com/movies/spirited-away-2025-10-17.html"),
+                     ("Sat Oct 18", "https://www.cinemark.com/movies/spirited-away-2025-10-18.html")]
+    assert cinemark_html.parse_show_dates(_read('winter-story.html'), "https://www.cinemark.com/movies/winter-story") == []
+
+def test_parse_show_dates_without_carousel():
+    try:
+        cinemark_html.parse_show_dates(_read('client-rendered.html'), "https://www.cinemark.com/movies/client-rendered")
+    except cinemark_html.ParseError:
+        return
+    raise AssertionError("expected ParseError")
+
+def test_parse_showtimes_sorts_and_deduplicates():
+    assert cinemark_html.parse_showtimes(_read('spirited-away.html')) == ['4:30pm', '7:00pm']
+    assert cinemark_html.parse_showtimes(_read('winter-story.html')) == []
@@ -0,0 +1,60 @@
+import asyncio
+import contextlib
+import io
+import os
+for name, value in (('BOT_TOKEN', 'token'), ('TMDB_API_KEY', 'key'), ('DISCORD_CHANNEL_ANIME_ID', '1'), ('DISCORD_CHANNEL_WATCHLIST_ID', '2')):
+    os.environ.setdefault(name, value)
+import database as db
+import main
+import scheduler as refresh_scheduler
+
+THEATER_URL = "https://www.cinemark.com/theaters/test-theater"
+TITLES = [f"Movie {i}" for i in range(20)]
+
+class FakeBackend:
+    name = 'fake'
+    def scrape_all_movies(self, job=None, theater_url=None):
+        movies = [{'title': title, 'release_date': '2030-01-01', 'cinemark_url': f"https://www.cinemark.com/movies/{i}", 'poster_url': ''} for i, title in enumerate(TITLES)]
+        # Streams one page per movie, so scrapes run while earlier movies are committed
+        for movie in movies:
+            if job: job.emit([movie])
+        return movies
+    def get_specific_showtimes(self, movie_url, job=None, theater_url=None):
+        return {"Fri Oct 17": ['7:00pm']}
+
+class FakeTmdb:
+    async def get_details_batch(self, titles, store, verdicts=None):
+        return {title: (None, True, 'Animation', 'overview') for title in titles}
+
+class FakeNotifications:
+    def __init__(self): self.sent = []
+    def notify(self, channel_id, embed, mentions=()): self.sent.append(channel_id)
+
+class SlowCommits(db.AsyncDatabase):
+    """Holds every check commit open a little after applying it, like a slow disk would."""
+    async def write(self, fn, *args):
+        result = await super().write(fn, *args)
+        if fn is db.apply_check_batch: await asyncio.sleep(0.02)
+        return result
+
+def test_check_saves_every_snapshot_while_commits_are_slow(tmp_path, monkeypatch):
+    async def run():
+        store = SlowCommits(str(tmp_path / 'movies.db'))
+        try:
+            await store.write(db.init_db, 'test-theater')
+            monkeypatch.setattr(main, 'store', store)
+            monkeypatch.setattr(main, 'scrape_backend', FakeBackend())
+            monkeypatch.setattr(main, 'tmdb_client', FakeTmdb())
+            monkeypatch.setattr(main, 'notifications', FakeNotifications())
+            monkeypatch.setattr(main, 'scheduler', refresh_scheduler.RefreshScheduler(budget_per_hour=1000))
+            monkeypatch.setattr(main, 'THEATERS', {'test-theater': THEATER_URL})
+            monkeypatch.setattr(main, 'CHECK_COMMIT_CHUNK', 1)
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert await main.perform_movie_check()
+            snapshots = [await store.read(db.get_showtime_snapshot, 'test-theater', title) for title in TITLES]
+            rows = await store.read(db.get_theater_movies, 'test-theater', TITLES)
+        finally:
+            store.close()
+        assert [title for title, snapshot in zip(TITLES, snapshots) if snapshot is None] == []
+        assert all(rows[title]['showtimes_digest'] for title in TITLES)
+    asyncio.run(run())
@@ -0,0 +1,26 @@
+import database as db
+import matcher
+
+def _rows(*patterns, is_regex=1):
+    return [{'user_id': i, 'pattern': pattern, 'is_regex': is_regex, 'theater': None} for i, pattern in enumerate(patterns)]
+
+def test_global_flags_stay_with_their_own_pattern():
+    index = matcher.PatternIndex([], _rows(r"(?x) spirited \s away", "a b", r"(?s)foo.bar", r"(.)\1", "zz"))
+    assert index.is_ignored("Spirited Away") and index.is_ignored("foo\nbar") and index.is_ignored("aa")
+    # '(?x)' would make the space in 'a b' insignificant if it leaked into the merged alternation
+    assert index.is_ignored("a b") and not index.is_ignored("ab")
+
+def test_index_built_across_an_invalidation_is_not_cached(monkeypatch):
+    matcher.invalidate()
+    entries = [_rows("old", is_regex=0)]
+    def read_ignore_entries(conn):
+        # A list command commits and invalidates while this build is still reading
+        rows = entries[-1]
+        entries.append(_rows("old", "new", is_regex=0))
+        matcher.invalidate()
+        return rows
+    monkeypatch.setattr(db, 'get_all_watchlist_entries', lambda conn: [])
+    monkeypatch.setattr(db, 'get_all_ignore_entries', read_ignore_entries)
+    assert not matcher.get_index(None).is_ignored("new")
+    assert matcher.get_index(None).is_ignored("new")
+    matcher.invalidate()
@@ -0,0 +1,81 @@
+import asyncio
+import time
+import discord
+import notifier
+
+class RateLimited(Exception):
+    status = 429
+    def __init__(self, retry_after):
+        super().__init__("429 Too Many Requests")
+        self.retry_after = retry_after
+
+class FakeChannel:
+    name = 'fake'
+    def __init__(self, fail_with=()):
+        self.messages = []
+        self.fail_with = list(fail_with)
+    async def send(self, content=None, embeds=()):
+        if self.fail_with: raise self.fail_with.pop(0)
+        self.messages.append((content, list(embeds)))
+
+class FakeClient:
+    """Only what Notifier uses: a channel cache and a REST fallback."""
+    def __init__(self, channel):
+        self.channel = channel
+        self.fetched = 0
+    def get_channel(self, channel_id):
+        return None
+    async def fetch_channel(self, channel_id):
+        self.fetched += 1
+        return self.channel
+
+def _send_all(channel, notifications):
+    async def run():
+        sender = notifier.Notifier(FakeClient(channel), batch_delay=0)
+        for args in notifications: sender.notify(*args)
+        await sender.drain(timeout=10)
+        return sender
+    return asyncio.run(run())
+
+def _embed(i, description="", url=None):
+    return discord.Embed(title=f"Movie {i}", description=description, url=url or f"https://www.cinemark.com/movies/{i}")
+
+def test_packs_at_most_ten_embeds_per_message():
+    channel = FakeChannel()
+    sender = _send_all(channel, [(1, _embed(i)) for i in range(12)])
+    assert [len(embeds) for _, embeds in channel.messages] == [10, 2]
+    assert [embed.title for _, embeds in channel.messages for embed in embeds] == [f"Movie {i}" for i in range(12)]
+    assert sender.sent_messages == 2
+
+def test_splits_messages_at_the_embed_character_limit():
+    channel = FakeChannel()
+    _send_all(channel, [(1, _embed(i, "x" * 2500)) for i in range(3)])
+    assert [len(embeds) for _, embeds in channel.messages] == [2, 1]
+    assert all(sum(len(embed) for embed in embeds) <= notifier.MAX_EMBED_CHARS_PER_MESSAGE for _, embeds in channel.messages)
+
+def test_merges_mentions_and_keeps_content_under_the_limit():
+    channel = FakeChannel()
+    crowd = [10**17 + i for i in range(60)]
+    _send_all(channel, [
+        (1, _embed(1), [5, 6]),
+        (1, _embed(2), [7]),
+        # Same movie again: packed next to the first and its mentions merged into the same message
+        (1, _embed(1, "update"), [6, 8]),
+        (1, _embed(3), crowd),
+        (1, _embed(4), [10**17 + 100 + i for i in range(60)]),
+    ])
+    # Movie 4's 60 mentions don't fit next to Movie 3's within 2000 characters, so it waits for the next message
+    (first_content, first_embeds), (second_content, second_embeds) = channel.messages
+    assert [embed.title for embed in first_embeds] == ["Movie 1", "Movie 1", "Movie 2", "Movie 3"]
+    assert [embed.title for embed in second_embeds] == ["Movie 4"]
+    assert first_content.split()[:4] == ["<@5>", "<@6>", "<@7>", "<@8>"]
+    assert len(first_content.split()) == 4 + len(crowd)
+    assert all(len(content) <= notifier.MAX_CONTENT_CHARS for content, _ in channel.messages)
+    assert "<@5>" not in second_content
+
+def test_waits_out_retry_after_on_429():
+    channel = FakeChannel(fail_with=[RateLimited(0.2)])
+    start = time.monotonic()
+    sender = _send_all(channel, [(1, _embed(1))])
+    assert time.monotonic() - start >= 0.2
+    assert len(channel.messages) == 1 and sender.sent_messages == 1
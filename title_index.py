@@ -0,0 +1,132 @@
+import bisect
+import heapq
+from itertools import islice
+import database as db
+
+MAX_GRAM = 3
+# Substring lookups walk the sorted keys instead of sorting a posting set once the set
+# holds more than this share of all keys; enough matches then turn up within a few keys
+DENSE_SHARE = 0.125
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def _all_grams(text):
+    return {gram for size in range(1, MAX_GRAM + 1) for gram in _grams(text, size)}
+
+def _word_grams(text):
+    """The first 1..MAX_GRAM characters of every word but the first."""
+    return {text[i:i + size] for i in range(1, len(text)) if text[i - 1] == ' ' for size in range(1, MAX_GRAM + 1) if i + size <= len(text)}
+
+class TitleIndex:
+    """
+    In-memory index of strings for autocomplete. Prefix lookups bisect a sorted
+    list of lowercased keys; substring lookups verify the smallest n-gram posting
+    set (up to trigrams), and word-start lookups a posting set of word prefixes.
+    Only the `limit` best matches are ever ranked.
+    """
+    def __init__(self, items=()):
+        self._originals = {}   # lowercased -> original string
+        self._sorted = []      # sorted lowercased keys
+        self._postings = {}    # n-gram -> set of lowercased keys
+        self._word_postings = {}  # prefix of a word after the first -> set of lowercased keys
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._originals)
+
+    def add(self, item):
+        key = item.lower()
+        if key in self._originals:
+            self._originals[key] = item
+            return
+        self._originals[key] = item
+        bisect.insort(self._sorted, key)
+        for gram in _all_grams(key):
+            self._postings.setdefault(gram, set()).add(key)
+        for gram in _word_grams(key):
+            self._word_postings.setdefault(gram, set()).add(key)
+
+    def remove(self, item):
+        key = item.lower()
+        if self._originals.pop(key, None) is None:
+            return
+        del self._sorted[bisect.bisect_left(self._sorted, key)]
+        for postings, grams in [(self._postings, _all_grams(key)), (self._word_postings, _word_grams(key))]:
+            for gram in grams:
+                keys = postings.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys: del postings[gram]
+
+    def _prefix_matches(self, query, limit):
+        matches = []
+        for key in self._sorted[bisect.bisect_left(self._sorted, query):]:
+            if not key.startswith(query) or len(matches) >= limit: break
+            matches.append(key)
+        return matches
+
+    def _substring_matches(self, query):
+        """Keys containing `query`, alphabetically and lazily, so callers can stop early."""
+        size = min(MAX_GRAM, len(query))
+        smallest = min((self._postings.get(gram, ()) for gram in _grams(query, size)), key=len)
+        if len(smallest) > len(self._sorted) * DENSE_SHARE:
+            return (key for key in self._sorted if query in key)
+        return iter(sorted(key for key in smallest if query in key))
+
+    def search(self, query, limit=25):
+        """
+        Returns up to `limit` originals ranked: prefix matches, then matches at the
+        start of a word, then any other substring match; alphabetical within each.
+        """
+        query = query.lower().strip()
+        if not query:
+            return [self._originals[key] for key in self._sorted[:limit]]
+        ranked = self._prefix_matches(query, limit)
+        need = limit - len(ranked)
+        if need > 0:
+            # Fewer than `limit` prefix matches means all of them are ranked already
+            word_start = f" {query}"
+            candidates = self._word_postings.get(query[:MAX_GRAM], ())
+            word_starts = heapq.nsmallest(need, (key for key in candidates if word_start in key and not key.startswith(query)))
+            ranked += word_starts
+            if len(word_starts) < need:
+                others = (key for key in self._substring_matches(query) if word_start not in key and not key.startswith(query))
+                ranked += islice(others, need - len(word_starts))
+        return [self._originals[key] for key in ranked]
+
+class AutocompleteIndex:
+    """Resident indexes behind the slash-command autocompletes: movie titles plus each user's lists."""
+    def __init__(self):
+        self.titles = TitleIndex()
+        self.watchlists = {}
+        self.ignore_lists = {}
+
+    def load(self, conn):
+        self.titles = TitleIndex(db.get_all_movie_titles(conn))
+        self.watchlists, self.ignore_lists = {}, {}
+        for row in db.get_all_watchlist_entries(conn):
+            self.watchlists.setdefault(row['user_id'], TitleIndex()).add(row['pattern'])
+        for row in db.get_all_ignore_entries(conn):
+            self.ignore_lists.setdefault(row['user_id'], TitleIndex()).add(row['pattern'])
+
+    def search_watchlist(self, user_id, query):
+        index = self.watchlists.get(user_id)
+        return index.search(query) if index else []
+
+    def search_ignore_list(self, user_id, query):
+        index = self.ignore_lists.get(user_id)
+        return index.search(query) if index else []
+
+    def watchlist_changed(self, user_id, pattern, added):
+        _apply(self.watchlists.setdefault(user_id, TitleIndex()), pattern, added)
+
+    def ignore_list_changed(self, user_id, pattern, added):
+        _apply(self.ignore_lists.setdefault(user_id, TitleIndex()), pattern, added)
+
+def _apply(title_index, item, added):
+    if added: title_index.add(item)
+    else: title_index.remove(item)
+
+index = AutocompleteIndex()
@@ -0,0 +1,150 @@
+import asyncio
+import time
+import os
+import aiohttp
+import database as db
+import classifier
+import metrics
+
+ANIME_KEYWORD_ID = 210024
+TMDB_BASE_URL = os.getenv('TMDB_BASE_URL') or "https://api.themoviedb.org/3"
+TMDB_MAX_CONCURRENCY = int(os.getenv('TMDB_MAX_CONCURRENCY') or 8)
+TMDB_MAX_RETRIES = int(os.getenv('TMDB_MAX_RETRIES') or 4)
+TMDB_REQUEST_TIMEOUT = float(os.getenv('TMDB_REQUEST_TIMEOUT') or 15)
+
+# TMDB cache lifetimes (hours). Negative entries cache "no search results".
+TMDB_CACHE_TTL = float(os.getenv('TMDB_CACHE_TTL_HOURS') or 168) * 3600
+TMDB_NEGATIVE_TTL = float(os.getenv('TMDB_NEGATIVE_TTL_HOURS') or 24) * 3600
+TMDB_GENRE_TTL = float(os.getenv('TMDB_GENRE_TTL_HOURS') or 24) * 3600
+
+class TMDBError(Exception):
+    """Raised when TMDB keeps failing after all retries."""
+
+class TMDBClient:
+    """
+    Asyncio TMDB client sharing one keep-alive connection pool. At most
+    max_concurrency requests are in flight at once, and 429/5xx responses are
+    retried with Retry-After-aware exponential backoff.
+    """
+    def __init__(self, api_key, base_url=TMDB_BASE_URL, max_concurrency=TMDB_MAX_CONCURRENCY, max_retries=TMDB_MAX_RETRIES):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._genre_lock = asyncio.Lock()
+        self._genre_map = None
+        self._genre_map_fetched_at = 0
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=TMDB_REQUEST_TIMEOUT))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_json(self, path, **params):
+        session = self._get_session()
+        params['api_key'] = self.api_key
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                metrics.incr('tmdb_requests')
+                with metrics.timer('tmdb_request'):
+                    async with session.get(f"{self.base_url}{path}", params=params) as res:
+                        if res.status != 429 and res.status < 500:
+                            res.raise_for_status()
+                            return await res.json()
+                        retry_after = res.headers.get('Retry-After')
+            metrics.incr('tmdb_retries')
+            # Back off outside the semaphore so other lookups can keep going
+            try: delay = float(retry_after)
+            except (TypeError, ValueError): delay = 2 ** attempt
+            if attempt < self.max_retries:
+                print(f"    -> TMDB returned {res.status} for {path}, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+        raise TMDBError(f"TMDB request to {path} failed after {self.max_retries + 1} attempts (last status {res.status}).")
+
+    async def get_genre_map(self, store=None):
+        """Returns TMDB's {genre_id: name} map, fetching it at most once per TMDB_GENRE_TTL."""
+        async with self._genre_lock:
+            if self._genre_map is not None and time.time() - self._genre_map_fetched_at < TMDB_GENRE_TTL:
+                return self._genre_map
+            genre_map = await store.read(db.get_cached_genres, TMDB_GENRE_TTL) if store else None
+            if genre_map is None:
+                data = await self._get_json("/genre/movie/list")
+                genre_map = {g['id']: g['name'] for g in data['genres']}
+                if store: await store.write(db.cache_genres, genre_map)
+            self._genre_map, self._genre_map_fetched_at = genre_map, time.time()
+            return genre_map
+
+    async def get_details(self, title, store=None, verdict=None):
+        """
+        Fetches details, checks for anime keyword, and gets overview in one go.
+        When a database store is given, search results and keyword verdicts are
+        served from (and stored in) the TMDB cache tables. `verdict` is the title's
+        classifier.Verdict, if it has already been classified.
+        Returns (details, is_anime, genres_str, overview).
+        """
+        # The title rules give the search title and a fallback anime verdict
+        cleaned_title, is_anime_by_pattern, _ = verdict or classifier.engine.classify(title)
+
+        try:
+            hit, movie_details = await store.read(db.get_cached_tmdb_search, cleaned_title, TMDB_CACHE_TTL, TMDB_NEGATIVE_TTL) if store else (False, None)
+            if not hit:
+                results = (await self._get_json("/search/movie", query=cleaned_title))['results']
+                movie_details = results[0] if results else None
+                if store: await store.write(db.cache_tmdb_search, cleaned_title, movie_details)
+            if not movie_details:
+                # If no results but we detected anime by pattern, still return as anime
+                if is_anime_by_pattern:
+                    return None, True, "Animation", "Anime movie detected by title pattern."
+                return None, False, "N/A", "N/A"
+
+            movie_id = movie_details.get('id')
+
+            # Get overview and truncate if necessary
+            overview = movie_details.get('overview', 'No description available.')
+            if len(overview) > 500:
+                overview = overview[:497] + '...'
+
+            genre_map = await self.get_genre_map(store)
+            genres = [genre_map.get(gid, '?') for gid in movie_details.get('genre_ids', [])]
+
+            is_anime_by_keyword = False
+            if movie_id:
+                cached = await store.read(db.get_cached_tmdb_keywords, movie_id, TMDB_CACHE_TTL) if store else None
+                if cached is None:
+                    keywords = (await self._get_json(f"/movie/{movie_id}/keywords")).get('keywords', [])
+                    is_anime_by_keyword = any(kw['id'] == ANIME_KEYWORD_ID for kw in keywords)
+                    if store: await store.write(db.cache_tmdb_keywords, movie_id, keywords, is_anime_by_keyword)
+                else:
+                    is_anime_by_keyword = cached
+
+            # Final anime determination: either TMDB keyword OR pattern detection
+            is_anime = is_anime_by_keyword or is_anime_by_pattern
+
+            return movie_details, is_anime, ", ".join(genres), overview
+        except (aiohttp.ClientError, asyncio.TimeoutError, TMDBError):
+            # If API fails but we detected anime by pattern, still return as anime
+            if is_anime_by_pattern:
+                return None, True, "Animation", "Anime movie detected by title pattern (API error)."
+            return None, False, "API Error", "API Error"
+
+    async def get_details_batch(self, titles, store=None, verdicts=None):
+        """
+        Looks up all titles concurrently. Titles missing from `verdicts` are classified
+        in one batch first (memoized in the database when a store is given).
+        Returns {title: (details, is_anime, genres_str, overview)}.
+        """
+        unique = list(dict.fromkeys(titles))
+        verdicts = dict(verdicts or {})
+        missing = [title for title in unique if title not in verdicts]
+        if missing:
+            verdicts.update((await store.write(classifier.classify_titles, missing))[0] if store else classifier.engine.classify_batch(missing))
+        results = await asyncio.gather(*(self.get_details(title, store, verdicts[title]) for title in unique))
+        return dict(zip(unique, results))
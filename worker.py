@@ -0,0 +1,169 @@
+import asyncio
+import socket
+import sqlite3
+import threading
+import os
+from datetime import datetime
+import database as db
+import backends
+import job_queue
+import metrics
+import scraper
+import tmdb
+from driver_pool import pool as driver_pool
+from scrape_jobs import ScrapeCancelled
+
+# Scrape worker: `python worker.py`. Pulls list, showtime and TMDB enrichment jobs from the
+# database queue that a bot started with SCRAPER_BACKEND=queue fills. Run as many as needed.
+TMDB_API_KEY = os.getenv('TMDB_API_KEY')
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+# Jobs this process runs at once; Selenium jobs each lease a browser from the pool
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY') or driver_pool.size)
+# How the worker itself scrapes: 'selenium' or 'http' (see SCRAPER_BACKEND)
+WORKER_SCRAPER_BACKEND = (os.getenv('WORKER_SCRAPER_BACKEND') or 'selenium').lower()
+
+class WorkerJob:
+    """
+    Worker-side handle for one leased queue job. It offers the same report/emit/
+    check_cancelled/sleep interface as scrape_jobs.ScrapeJob, so the scraping functions
+    run unchanged, and counts as cancelled once the worker has lost the lease.
+    """
+    def __init__(self, row):
+        self.id = row['id']
+        self.name = f"{row['kind']}#{row['id']}"
+        self._lost = threading.Event()
+
+    def report(self, message):
+        pass  # scraper.report_progress already prints it
+
+    def emit(self, item):
+        pass  # only the final result goes back through the queue
+
+    def check_cancelled(self):
+        if self._lost.is_set():
+            raise ScrapeCancelled(f"Lost the lease on job {self.name}.")
+
+    def sleep(self, seconds):
+        self._lost.wait(seconds)
+        self.check_cancelled()
+
+    def lose(self):
+        self._lost.set()
+
+class Worker:
+    """
+    Runs `concurrency` threads that claim jobs, plus one thread that heartbeats the
+    leases of every running job. A job whose lease is lost (it expired, or the bot
+    cancelled it) is abandoned; failures go back to the queue to be retried.
+    """
+    def __init__(self, backend, store, worker_id=WORKER_ID, concurrency=WORKER_CONCURRENCY):
+        self.backend = backend
+        self.store = store
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.handlers = {
+            job_queue.LIST_JOB: self._scrape_list,
+            job_queue.SHOWTIMES_JOB: self._scrape_showtimes,
+            job_queue.ENRICH_JOB: self._enrich,
+        }
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # --- Job Handlers ---
+    def _scrape_list(self, payload, job):
+        return self.backend.scrape_all_movies(job=job, theater_url=payload['theater_url'])
+
+    def _scrape_showtimes(self, payload, job):
+        return self.backend.get_specific_showtimes(payload['movie_url'], job=job, theater_url=payload['theater_url'])
+
+    def _enrich(self, payload, job):
+        async def lookup():
+            # A fresh client per job: its connection pool belongs to this job's event loop
+            client = tmdb.TMDBClient(TMDB_API_KEY)
+            try: return await client.get_details_batch(payload['titles'], self.store)
+            finally: await client.close()
+        # The bot only uses the verdict, genres and overview, so the raw details stay here
+        return {title: [None, is_anime, genres, overview] for title, (_, is_anime, genres, overview) in asyncio.run(lookup()).items()}
+
+    # --- Queue Loop ---
+    def run(self):
+        threads = [threading.Thread(target=self._heartbeat, name='heartbeat', daemon=True)]
+        threads += [threading.Thread(target=self._work, name=f'worker-{i}', daemon=True) for i in range(self.concurrency)]
+        for thread in threads: thread.start()
+        print(f"Worker {self.worker_id} running {self.concurrency} job thread(s) with the {self.backend.name} backend.")
+        try:
+            while not self._stop.wait(1): pass
+        except KeyboardInterrupt:
+            print("Stopping; running jobs are abandoned and will be retried by other workers.")
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            for job in self._active.values(): job.lose()
+
+    def _work(self):
+        conn = db.get_connection()
+        while not self._stop.is_set():
+            try: row = db.claim_job(conn, self.worker_id, list(self.handlers), job_queue.JOB_LEASE_SECONDS)
+            except sqlite3.OperationalError as e:
+                print(f"WARNING: Could not claim a job: {e}")
+                row = None
+            if row is None:
+                self._stop.wait(job_queue.JOB_POLL_INTERVAL)
+                continue
+            self._execute(conn, row)
+        conn.close()
+
+    def _execute(self, conn, row):
+        job = WorkerJob(row)
+        with self._lock: self._active[job.id] = job
+        print(f"[{datetime.now()}] Running job {job.name} (attempt {row['attempts']}/{row['max_attempts']})")
+        try:
+            with metrics.timer(f"job:{row['kind']}"):
+                result = self.handlers[row['kind']](row['payload'], job)
+            if isinstance(result, dict) and "Error" in result:
+                self._fail(conn, row, result["Error"])
+            elif not db.complete_job(conn, job.id, self.worker_id, result):
+                print(f"    -> Job {job.name} finished after its lease was lost; result dropped.")
+            else:
+                metrics.incr('jobs_completed')
+        except ScrapeCancelled:
+            print(f"    -> Abandoned job {job.name}: its lease was lost.")
+        except Exception as e:
+            self._fail(conn, row, f"{type(e).__name__}: {e}")
+        finally:
+            with self._lock: self._active.pop(job.id, None)
+
+    def _fail(self, conn, row, error):
+        metrics.incr('jobs_failed')
+        print(f"    -> Job {row['kind']}#{row['id']} failed: {error}")
+        try: db.fail_job(conn, row['id'], self.worker_id, error, job_queue.JOB_RETRY_SECONDS * row['attempts'])
+        except sqlite3.OperationalError as e: print(f"WARNING: Could not record the failure ({e}); the lease will expire instead.")
+
+    def _heartbeat(self):
+        conn = db.get_connection()
+        while not self._stop.wait(job_queue.JOB_HEARTBEAT_SECONDS):
+            with self._lock: active = dict(self._active)
+            if not active: continue
+            try: held = db.heartbeat_jobs(conn, self.worker_id, list(active), job_queue.JOB_LEASE_SECONDS)
+            except sqlite3.OperationalError as e:
+                print(f"WARNING: Heartbeat failed: {e}")
+                continue
+            for job_id, job in active.items():
+                if job_id not in held: job.lose()
+        conn.close()
+
+if __name__ == "__main__":
+    if WORKER_SCRAPER_BACKEND == 'queue':
+        print("FATAL: WORKER_SCRAPER_BACKEND must be 'selenium' or 'http'; a worker can't hand its jobs to the queue.")
+        exit()
+    if not TMDB_API_KEY: print("WARNING: TMDB_API_KEY is not set; enrichment jobs will report API errors.")
+    db.init_db(default_theater=scraper.theater_id(scraper.DEFAULT_THEATER_URL))
+    store = db.AsyncDatabase()
+    metrics.serve()
+    try: Worker(backends.create_backend(WORKER_SCRAPER_BACKEND, driver_pool, WORKER_CONCURRENCY), store).run()
+    finally:
+        driver_pool.close()
+        store.close()